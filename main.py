@@ -1,15 +1,26 @@
 import os
 import sys
 import json
+import re
+import time
+import random
 import requests
 import logging
 import argparse
+import functools
 import tempfile
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from ebaysdk.trading import Connection as Trading
-from ebaysdk.exception import ConnectionError
+from lxml import etree
 
 # Platform-specific imports
 try:
@@ -21,6 +32,20 @@ except ImportError:
     import warnings
     warnings.warn("fcntl not available - file locking disabled. Concurrent writes may corrupt data.", RuntimeWarning)
 
+# C-accelerated JSON for tracking history I/O (in requirements.txt; stdlib json is the fallback)
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Optional C ISO 8601 parser for timestamps that miss the string-compare fast path
+try:
+    import ciso8601
+    HAS_CISO8601 = True
+except ImportError:
+    HAS_CISO8601 = False
+
 # Try importing shared_ebay, with fallback to local APIHelpers
 try:
     from shared_ebay.auth import ensure_valid_token, get_token_manager
@@ -41,9 +66,118 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Guards the shared tracking history while accounts and Parcel uploads run on worker threads
+_history_lock = threading.Lock()
+# Serializes eBay token refresh, which may rewrite .env
+_token_lock = threading.Lock()
+
+# Tracking history: one JSON record per line, appended as shipments are added.
+# LEGACY_HISTORY_FILE (a single JSON array) is still read and migrated on first write.
+HISTORY_FILE = "tracking_history.jsonl"
+LEGACY_HISTORY_FILE = "tracking_history.json"
+HISTORY_LOCKFILE = ".tracking_history.lock"
+# Recently fetched GetOrders results, one file per account and window (see EbayClient.iter_orders)
+ORDERS_CACHE_DIR = ".cache"
+
+# Per-request timeouts; without one a stalled connection hangs the run
+# Parcel: (connect, read) so an unreachable host fails fast
+PARCEL_TIMEOUT_SECONDS = (5, 15)
+EBAY_TIMEOUT_SECONDS = 60
+# How many times one shipment may be requeued after a 429 before the run gives up
+PARCEL_RATE_LIMIT_REQUEUES = 2
+
+# eBay carrier names -> Parcel carrier codes. One case-insensitive pass over the
+# carrier string; USPS is listed before UPS so it wins the alternation.
+_CARRIER_RE = re.compile(r"(USPS|UPS|FEDEX|DHL|AMAZON)", re.IGNORECASE)
+_CARRIER_CODES = {
+    'USPS': 'usps',
+    'UPS': 'ups',
+    'FEDEX': 'fedex',
+    'DHL': 'dhl',
+    'AMAZON': 'amazon-logistics'
+}
+# Sent when eBay gives no carrier at all
+_UNKNOWN_CARRIER_CODE = 'pholder'
+
+# Only the GetOrders fields tracking extraction reads; eBay trims everything else
+# (buyer/seller details, addresses, payments, item specifics) server-side.
+# Ack/Errors are always returned. The REST Fulfillment API would allow richer
+# filters but only serves seller-side orders, so buyer purchases stay on Trading.
+GET_ORDERS_OUTPUT_SELECTOR = [
+    'OrderArray.Order.OrderID',
+    'OrderArray.Order.CreatedTime',
+    'OrderArray.Order.PaidTime',
+    'OrderArray.Order.ShippedTime',
+    'OrderArray.Order.ShippingDetails',
+    'OrderArray.Order.ShipmentArray',
+    'OrderArray.Order.TransactionArray.Transaction.Item.Title',
+    'OrderArray.Order.TransactionArray.Transaction.ShippingDetails.ShipmentTrackingDetails',
+    'HasMoreOrders',
+    'PaginationResult',
+]
+# GetOrders page size (eBay allows up to 100)
+GET_ORDERS_PAGE_SIZE = 100
+
 def _env_key(base: str, suffix: str) -> str:
     return f"{base}_{suffix}" if suffix else base
 
+# Per-account eBay settings, resolved together by _ebay_env
+_EBAY_ENV_KEYS = ("EBAY_APP_ID", "EBAY_CLIENT_SECRET", "EBAY_DEV_ID", "EBAY_REFRESH_TOKEN")
+
+def _ebay_env(suffix: str) -> dict:
+    """Read one account's EBAY_* settings (suffixed for accounts 2+) in a single pass."""
+    return {key: os.getenv(_env_key(key, suffix)) for key in _EBAY_ENV_KEYS}
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+# Run-wide settings, read once at import (after load_dotenv)
+MAX_SHIPMENT_AGE_DAYS = _env_int("MAX_SHIPMENT_AGE_DAYS", 45)
+PARCEL_MAX_PER_RUN = _env_int("PARCEL_MAX_PER_RUN", 20)
+PARCEL_CONCURRENCY = _env_int("PARCEL_CONCURRENCY", 4)
+# GetOrders pages fetched in parallel per account after the first
+EBAY_MAX_CONCURRENCY = _env_int("EBAY_MAX_CONCURRENCY", 5)
+# How long fetched orders are reused from ORDERS_CACHE_DIR (0 disables the cache)
+EBAY_CACHE_TTL_SEC = _env_int("EBAY_CACHE_TTL_SEC", 900)
+# History entries older than this are dropped at the start of a run (0 keeps everything).
+# An entry is only safe to forget once its shipment can no longer pass the age filter,
+# so prune_history never uses less than MAX_SHIPMENT_AGE_DAYS + 1. Orders with no
+# timestamp never age out, so an evicted one of those can still be re-sent.
+HISTORY_TTL_DAYS = _env_int("HISTORY_TTL_DAYS", 180)
+# 429 retries inside add_delivery: wait Retry-After (or PARCEL_BACKOFF_BASE * 2^attempt)
+# plus jitter, never longer than PARCEL_MAX_BACKOFF seconds
+PARCEL_MAX_RETRIES = _env_int("PARCEL_MAX_RETRIES", 3)
+PARCEL_BACKOFF_BASE = _env_float("PARCEL_BACKOFF_BASE", 1.0)
+PARCEL_MAX_BACKOFF = 60
+# Parcel responses slower than this halve the upload concurrency like a 429 does
+PARCEL_LATENCY_TARGET_SEC = _env_float("PARCEL_LATENCY_TARGET_SEC", 2.0)
+
+
+class EbayApiError(Exception):
+    """eBay returned an error-severity response to a Trading API call."""
+
+
+@functools.lru_cache(maxsize=8)
+def _make_trading(suffix: str, token: str):
+    """Build the ebaysdk Trading connection for an account, once per (suffix, token).
+
+    Returns (Trading, Lock). Every EbayClient for the same account shares the
+    Trading object, so the lock guarding its build_request is shared with it.
+    """
+    env = _ebay_env(suffix)
+    trading = Trading(
+        appid=env["EBAY_APP_ID"],
+        certid=env["EBAY_CLIENT_SECRET"], # ebaysdk uses certid for client secret in some contexts
+        devid=env["EBAY_DEV_ID"],
+        token=token,
+        config_file=None,
+        domain="api.ebay.com"
+    )
+    return trading, threading.Lock()
+
 
 class EbayClient:
     def __init__(self, suffix: str = ""):
@@ -51,57 +185,341 @@ class EbayClient:
         if not ensure_valid_token(suffix=suffix):
             raise Exception(f"Failed to obtain valid eBay token for suffix '{suffix}'")
             
+        self.suffix = suffix
         self.token = get_token_manager(suffix=suffix).get_current_token()
-        self.api = Trading(
-            appid=os.getenv(_env_key("EBAY_APP_ID", suffix)),
-            certid=os.getenv(_env_key("EBAY_CLIENT_SECRET", suffix)), # ebaysdk uses certid for client secret in some contexts
-            devid=os.getenv(_env_key("EBAY_DEV_ID", suffix)),
-            token=self.token,
-            config_file=None,
-            domain="api.ebay.com"
-        )
+        self.api, self._build_lock = _make_trading(suffix, self.token)
+        # ebaysdk is only used to build the signed Trading request; we send it on our
+        # own keep-alive session and parse the XML ourselves (see _execute)
+        self._session = requests.Session()
+
+    def close(self):
+        """Release the pooled eBay connection."""
+        self._session.close()
+
+    def _execute(self, verb, data):
+        """POST a Trading API call and return the parsed response root element.
+
+        Bypasses ebaysdk's response pipeline, which converts the XML to dicts
+        twice (computing a dotted node path for every element) and closes its
+        connection after each call. Callers convert only the parts they read
+        (see _element_to_dict and _orders_from_xml).
+        """
+        # build_request replaces self.api.request, so build and grab it atomically
+        with self._build_lock:
+            self.api.build_request(verb, data, None)
+            request = self.api.request
+        response = self._session.send(request, timeout=EBAY_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return etree.fromstring(response.content)
+
+    def _get_orders_page(self, create_time_from, create_time_to, page_number):
+        """Fetch one GetOrders page; returns (orders list, has_more, total pages or None).
+
+        Safe to call from several threads: only building the signed request
+        touches the shared ebaysdk connection, and that is done under a lock.
+
+        Raises:
+            EbayApiError: eBay answered with an error-severity Errors entry
+        """
+        root = self._execute('GetOrders', {
+            'CreateTimeFrom': create_time_from,
+            'CreateTimeTo': create_time_to,
+            'OrderRole': 'Buyer',
+            'DetailLevel': 'ReturnAll',
+            'Pagination': {
+                'EntriesPerPage': GET_ORDERS_PAGE_SIZE,
+                'PageNumber': page_number
+            },
+            'OutputSelector': GET_ORDERS_OUTPUT_SELECTOR
+        })
+
+        ack = root.findtext('{*}Ack')
+        errors = [_element_to_dict(error) for error in root.iterfind('{*}Errors')]
+        if any(error.get('SeverityCode') == 'Error' for error in errors):
+            raise EbayApiError(f"GetOrders returned Ack={ack} Errors={errors}")
+        if ack != 'Success':
+            logger.warning(f"GetOrders returned Ack={ack} Errors={errors}")
+
+        has_more = (root.findtext('{*}HasMoreOrders') or '').strip().lower() == 'true'
+        total_pages = root.findtext('{*}PaginationResult/{*}TotalNumberOfPages')
+        total_pages = int(total_pages) if total_pages else None
+        return list(_orders_from_xml(root)), has_more, total_pages
+
+    def iter_order_pages(self, days_back=90):
+        """Yield the buyer's orders from the last N days one GetOrders page at a time.
+
+        Pages are fetched at most EBAY_MAX_CONCURRENCY ahead of the caller, so
+        a caller that stops early never fetches the rest and only a bounded
+        number of pages is held at once.
+
+        Raises:
+            EbayApiError, requests.RequestException: a page could not be fetched
+        """
+        # Calculate time range
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(days=days_back)
+
+        # Format dates for eBay API (ISO 8601)
+        # Trading API expects: YYYY-MM-DDTHH:MM:SS.SSSZ
+        create_time_from = start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        create_time_to = end_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+        order_array, has_more, total_pages = self._get_orders_page(create_time_from, create_time_to, 1)
+        logger.info(f"GetOrders page 1 of {total_pages or '?'} retrieved {len(order_array)} orders")
+        yield order_array
+        if not has_more:
+            return
+
+        # The first page tells us how many remain; fetch up to EBAY_MAX_CONCURRENCY
+        # of them ahead in parallel while still yielding in page order. Without
+        # a page count, keep going until a page reports no more orders.
+        pages = range(2, total_pages + 1) if total_pages else itertools.count(2)
+        pages = iter(pages)
+        window = deque()
+        with ThreadPoolExecutor(max_workers=EBAY_MAX_CONCURRENCY) as executor:
+            def submit(page_number):
+                future = executor.submit(self._get_orders_page, create_time_from, create_time_to, page_number)
+                window.append((page_number, future))
+
+            try:
+                for page_number in itertools.islice(pages, EBAY_MAX_CONCURRENCY):
+                    submit(page_number)
+                while window:
+                    page_number, future = window.popleft()
+                    order_array, has_more, _ = future.result()
+                    logger.info(f"GetOrders page {page_number} of {total_pages or '?'} retrieved {len(order_array)} orders")
+                    yield order_array
+                    if not has_more:
+                        break
+                    for page_number in itertools.islice(pages, 1):
+                        submit(page_number)
+            finally:
+                # Caller stopped early, a page failed, or we ran past the end
+                for _, future in window:
+                    future.cancel()
+
+    def iter_orders(self, days_back=90, use_cache=True):
+        """Yield individual orders across all GetOrders pages (see iter_order_pages).
+
+        With ``use_cache`` and EBAY_CACHE_TTL_SEC > 0, a fetch from the last
+        EBAY_CACHE_TTL_SEC seconds for the same account and window is replayed
+        from disk instead, and a fully consumed fetch is written back.
+        """
+        cache_path = _orders_cache_path(self.suffix, days_back) if use_cache and EBAY_CACHE_TTL_SEC > 0 else None
+        if cache_path:
+            cached = _read_orders_cache(cache_path)
+            if cached is not None:
+                logger.info(f"Using {len(cached)} cached orders from {cache_path}")
+                yield from cached
+                return
+
+        fetched = []
+        for page in self.iter_order_pages(days_back=days_back):
+            if cache_path:
+                fetched.extend(page)
+            yield from page
+        if cache_path:
+            _write_orders_cache(cache_path, fetched)
+
+    def get_recent_orders(self, days_back=90, use_cache=True):
+        """Fetch orders from the last N days where the user is the buyer.
 
-    def get_recent_orders(self, days_back=90):
-        """Fetch orders from the last N days where the user is the buyer."""
+        Returns:
+            GetOrders-shaped dict with every page's orders under OrderArray.Order,
+            or None if any page failed
+        """
         try:
-            # Calculate time range
-            end_time = datetime.now(timezone.utc)
-            start_time = end_time - timedelta(days=days_back)
-            
-            # Format dates for eBay API (ISO 8601)
-            # Trading API expects: YYYY-MM-DDTHH:MM:SS.SSSZ
-            create_time_from = start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-            create_time_to = end_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-
-            response = self.api.execute('GetOrders', {
-                'CreateTimeFrom': create_time_from,
-                'CreateTimeTo': create_time_to,
-                'OrderRole': 'Buyer',
-                'DetailLevel': 'ReturnAll'
-            })
-            
-            data = response.dict()
-            ack = data.get('Ack')
-            if ack != 'Success':
-                logger.warning(f"GetOrders returned Ack={ack} Errors={data.get('Errors')}")
-            order_array = data.get('OrderArray', {}).get('Order', [])
-            if isinstance(order_array, dict):
-                order_array = [order_array]
+            order_array = list(self.iter_orders(days_back=days_back, use_cache=use_cache))
             logger.info(f"GetOrders retrieved {len(order_array)} orders")
-            return data
+            return {'OrderArray': {'Order': order_array}}
             
-        except ConnectionError as e:
+        except EbayApiError as e:
+            logger.error(f"eBay API Error: {e}")
+            return None
+        except requests.RequestException as e:
             logger.error(f"eBay API Connection Error: {e}")
             return None
         except Exception as e:
             logger.error(f"Error fetching orders: {e}")
             return None
 
+def _element_to_dict(element):
+    """Convert an lxml element to nested dicts, in ebaysdk's ``response.dict()`` shape.
+
+    Namespaces are dropped, leaf elements become their stripped text, repeated
+    child tags collapse into a list, and attributes appear as ``_name`` keys
+    (with the text under ``value``). Unlike ebaysdk, a lone Order/Transaction
+    stays a dict rather than being forced into a one-item list; callers already
+    accept either.
+    """
+    children = [child for child in element if isinstance(child.tag, str)]
+    text = element.text.strip() if element.text else None
+
+    if not children and not element.attrib:
+        return text
+
+    result = {f"_{key}": value for key, value in element.attrib.items()}
+    for child in children:
+        tag = etree.QName(child).localname
+        value = _element_to_dict(child)
+        if tag not in result:
+            result[tag] = value
+        elif isinstance(result[tag], list):
+            result[tag].append(value)
+        else:
+            result[tag] = [result[tag], value]
+    if text and not children:
+        result['value'] = text
+    return result
+
+def _select_to_dict(element, fields):
+    """Like _element_to_dict, but only converts the child tags named in ``fields``.
+
+    ``fields`` maps a child's local tag name to the fields to keep beneath it,
+    or to None to convert that child in full.
+    """
+    result = {}
+    has_children = False
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+        has_children = True
+        tag = etree.QName(child).localname
+        if tag not in fields:
+            continue
+        subfields = fields[tag]
+        value = _element_to_dict(child) if subfields is None else _select_to_dict(child, subfields)
+        if tag not in result:
+            result[tag] = value
+        elif isinstance(result[tag], list):
+            result[tag].append(value)
+        else:
+            result[tag] = [result[tag], value]
+    if not has_children:
+        return _element_to_dict(element)
+    return result
+
+# The parts of a GetOrders Order that tracking extraction reads
+_ORDER_FIELDS = {
+    'CreatedTime': None,
+    'PaidTime': None,
+    'ShippedTime': None,
+    'ShippingDetails': {'ShipmentTrackingDetails': None},
+    'ShipmentArray': None,
+    'TransactionArray': {
+        'Transaction': {
+            'Item': {'Title': None},
+            'ShippingDetails': {'ShipmentTrackingDetails': None}
+        }
+    }
+}
+
+def _orders_from_xml(root):
+    """Yield each Order of a GetOrders response as a dict of just _ORDER_FIELDS."""
+    for order in root.iterfind('{*}OrderArray/{*}Order'):
+        yield _select_to_dict(order, _ORDER_FIELDS)
+
+class AdaptiveLimiter:
+    """AIMD (additive-increase, multiplicative-decrease) cap on concurrent requests.
+
+    Each success grows the limit by roughly one slot per window's worth of
+    responses; each overload (429) or slow response halves it. A 429 that
+    arrives while the limit is already at its floor marks the limiter
+    exhausted, which callers treat as "stop for this run"; slowness alone never
+    does.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self._limit = float(min(max(initial, minimum), self.maximum))
+        self._exhausted = False
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def exhausted(self):
+        return self._exhausted
+
+    def _set(self, limit):
+        # Caller holds the lock
+        previous = self.limit
+        self._limit = limit
+        if self.limit != previous:
+            logger.debug(f"Concurrency limit {previous} -> {self.limit}")
+
+    def on_success(self):
+        with self._lock:
+            self._exhausted = False
+            self._set(min(self.maximum, self._limit + 1 / self._limit))
+
+    def on_slow(self):
+        """A request succeeded but took longer than the latency target."""
+        with self._lock:
+            self._exhausted = False
+            self._set(max(self.minimum, self._limit / 2))
+
+    def on_overload(self):
+        with self._lock:
+            if self._limit <= self.minimum:
+                self._exhausted = True
+            self._set(max(self.minimum, self._limit / 2))
+
+
+def _backoff_delay(response, attempt):
+    """Seconds to wait before retrying a 429: Retry-After if given, else exponential, plus jitter."""
+    try:
+        delay = float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        # Missing, or an HTTP-date we don't bother parsing
+        delay = PARCEL_BACKOFF_BASE * 2 ** attempt
+    delay = min(max(delay, 0), PARCEL_MAX_BACKOFF)
+    return min(delay + random.uniform(0, 0.5 * delay), PARCEL_MAX_BACKOFF)
+
+
 class ParcelClient:
     def __init__(self, dry_run=False):
         self.api_key = os.getenv("PARCEL_API_KEY")
         self.base_url = "https://api.parcel.app/external/add-delivery/"
         self.dry_run = dry_run
+        # Last X-Concurrent-Remaining value Parcel advertised (None until seen)
+        self.concurrent_remaining = None
+        self.limiter = AdaptiveLimiter(maximum=PARCEL_CONCURRENCY)
+        # Set once the run gives up on Parcel's rate limit (see halt)
+        self._halted = threading.Event()
+        # Requests in flight across every add_deliveries caller (one per account
+        # thread), so the AIMD limit and PARCEL_CONCURRENCY bound the whole run
+        self._in_flight = 0
+        self._slots = threading.Condition()
+
+        # One pooled session per client so repeated POSTs reuse the keep-alive
+        # TLS connection instead of paying a fresh handshake per shipment
+        self._session = requests.Session()
+        self._session.headers.update({
+            "api-key": self.api_key or "",
+            "Content-Type": "application/json"
+        })
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+            # 429s are retried by add_delivery (capped backoff, AIMD, halt); urllib3
+            # would otherwise replay them itself, sleeping the uncapped Retry-After
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        # Every request goes to one host; keep enough idle connections for all
+        # add_deliveries workers so none is dropped and re-handshaked after use
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(8, PARCEL_CONCURRENCY),
+            max_retries=retry
+        )
+        self._session.mount("https://", adapter)
 
         if not self.api_key and not dry_run:
             logger.warning("PARCEL_API_KEY not found in environment variables")
@@ -109,6 +527,63 @@ class ParcelClient:
         if dry_run:
             logger.info("🔍 DRY-RUN MODE: No API calls will be made to Parcel")
 
+    def close(self):
+        """Release the pooled Parcel connections."""
+        self._session.close()
+
+    def halt(self):
+        """Stop all further Parcel requests this run, including retries waiting out a 429."""
+        self._halted.set()
+        with self._slots:
+            self._slots.notify_all()
+
+    @property
+    def halted(self):
+        return self._halted.is_set()
+
+    def concurrency_window(self, max_workers):
+        """How many requests may be in flight, per the AIMD limit and Parcel's advertised budget."""
+        window = min(max_workers, self.limiter.limit)
+        remaining = self.concurrent_remaining
+        if remaining is not None:
+            window = min(window, remaining)
+        return max(1, window)
+
+    def _acquire_slot(self, max_workers, block):
+        """Claim a client-wide in-flight slot; with ``block``, wait for one unless halted."""
+        with self._slots:
+            while self._in_flight >= self.concurrency_window(max_workers):
+                if not block or self.halted:
+                    return False
+                self._slots.wait()
+            self._in_flight += 1
+            return True
+
+    def _release_slot(self):
+        with self._slots:
+            self._in_flight -= 1
+            # The window may also have grown with this response; wake every waiter
+            self._slots.notify_all()
+
+    def _add_delivery_in_slot(self, tracking_number, carrier_code, description):
+        try:
+            return self.add_delivery(
+                tracking_number=tracking_number,
+                carrier_code=carrier_code,
+                description=description
+            )
+        finally:
+            self._release_slot()
+
+    def _record_concurrency(self, response):
+        value = response.headers.get("X-Concurrent-Remaining")
+        if value is None:
+            return
+        try:
+            self.concurrent_remaining = int(value)
+        except (TypeError, ValueError):
+            pass
+
     def add_delivery(self, tracking_number, carrier_code, description):
         """Add a delivery to Parcel app.
 
@@ -128,11 +603,9 @@ class ParcelClient:
             logger.error("Cannot add delivery: Missing Parcel API Key")
             return False, False
 
-        headers = {
-            "api-key": self.api_key,
-            "Content-Type": "application/json"
-        }
-        
+        if self.halted:
+            return False, True
+
         data = {
             "tracking_number": tracking_number,
             "carrier_code": carrier_code,
@@ -141,7 +614,30 @@ class ParcelClient:
         }
         
         try:
-            response = requests.post(self.base_url, headers=headers, json=data)
+            for attempt in range(PARCEL_MAX_RETRIES + 1):
+                started = time.monotonic()
+                response = self._session.post(self.base_url, json=data, timeout=PARCEL_TIMEOUT_SECONDS)
+                latency = time.monotonic() - started
+                self._record_concurrency(response)
+                if response.status_code != 429:
+                    # Parcel slowing down is the early sign of overload; back off before the 429s
+                    if latency > PARCEL_LATENCY_TARGET_SEC:
+                        self.limiter.on_slow()
+                    else:
+                        self.limiter.on_success()
+                    break
+                self.limiter.on_overload()
+                if attempt == PARCEL_MAX_RETRIES:
+                    break
+                delay = _backoff_delay(response, attempt)
+                logger.warning(
+                    f"Rate limited by Parcel while adding {tracking_number}; "
+                    f"retrying in {delay:.1f}s ({attempt + 1}/{PARCEL_MAX_RETRIES})"
+                )
+                # Wakes early if another request made the run give up
+                if self._halted.wait(delay):
+                    break
+
             error_message = None
             try:
                 error_json = response.json()
@@ -163,7 +659,10 @@ class ParcelClient:
                     return False, False
 
             if response.status_code == 429:
-                logger.error(f"Rate limited by Parcel while adding {tracking_number}; stopping further requests. Message: {error_message or response.text}")
+                logger.warning(
+                    f"Rate limited by Parcel while adding {tracking_number} after {attempt} retries "
+                    f"(concurrency now {self.limiter.limit}). Message: {error_message or response.text}"
+                )
                 return False, True
 
             logger.error(
@@ -176,235 +675,537 @@ class ParcelClient:
             logger.error(f"Error adding delivery to Parcel: {e}")
             return False, False
 
-def load_history():
-    if os.path.exists("tracking_history.json"):
+    def add_deliveries(self, items, max_workers=None):
+        """Add several deliveries to Parcel, fanning add_delivery out over a thread pool.
+
+        Parcel's external API only accepts one delivery per request, so the
+        batch is sent as concurrent single POSTs over the pooled session.
+        Keeps at most ``concurrency_window(max_workers)`` requests in flight,
+        counted across every concurrent caller of this client.
+        A rate-limited item is requeued (up to PARCEL_RATE_LIMIT_REQUEUES times)
+        while the AIMD limiter still has room to back off; once the limiter is
+        exhausted the client is halted: nothing more is submitted, in-flight
+        requests waiting out a 429 give up, and later calls send nothing.
+
+        Args:
+            items: (tracking_number, carrier_code, description) tuples
+            max_workers: Upper bound on concurrent requests (default: PARCEL_CONCURRENCY)
+
+        Returns:
+            (added tracking numbers in completion order, rate_limited: bool)
+        """
+        if max_workers is None:
+            max_workers = PARCEL_CONCURRENCY
+        added = []
+        rate_limited = False
+        if not items:
+            return added, rate_limited
+
+        queue = deque((item, 0) for item in items)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            while queue or in_flight:
+                # Only block for a slot when none of our own requests will free one
+                while queue and not rate_limited and self._acquire_slot(max_workers, block=not in_flight):
+                    item, requeues = queue.popleft()
+                    in_flight[executor.submit(self._add_delivery_in_slot, *item)] = (item, requeues)
+
+                if not in_flight:
+                    if queue and self.halted:
+                        # Another caller gave up on the rate limit while we waited for a slot
+                        rate_limited = True
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, requeues = in_flight.pop(future)
+                    success, limited = future.result()
+                    if limited:
+                        if self.halted or self.limiter.exhausted or requeues >= PARCEL_RATE_LIMIT_REQUEUES:
+                            # Drop the queue and cut short in-flight backoffs
+                            rate_limited = True
+                            self.halt()
+                        else:
+                            queue.append((item, requeues + 1))
+                    if success:
+                        added.append(item[0])
+
+        logger.info(f"Parcel concurrency limit ended at {self.limiter.limit} after {len(items)} shipments")
+        return added, rate_limited
+
+def _json_loads(data):
+    """Parse JSON bytes or text with orjson when available (its JSONDecodeError subclasses json's)."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj):
+    """Serialize to compact single-line UTF-8 JSON bytes (one history record per line)."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def _orders_cache_path(suffix, days_back):
+    return Path(ORDERS_CACHE_DIR) / f"ebay_{suffix or 'default'}_{days_back}.json"
+
+def _read_orders_cache(path):
+    """Return the cached order list at ``path``, or None if missing, stale or unreadable."""
+    try:
+        with open(path, 'rb') as f:
+            cached = _json_loads(f.read())
+        if time.time() - cached['fetched_at'] > EBAY_CACHE_TTL_SEC:
+            return None
+        return cached['orders']
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable orders cache {path}: {e}")
+        return None
+
+def _write_orders_cache(path, orders):
+    """Atomically write ``orders`` to the cache at ``path``; failures are only logged."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.orders_', suffix='.tmp')
+        try:
+            with os.fdopen(temp_fd, 'wb') as f:
+                f.write(_json_dumps({'fetched_at': time.time(), 'orders': orders}))
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+    except Exception as e:
+        logger.warning(f"Could not write orders cache {path}: {e}")
+
+@contextmanager
+def _history_file_lock():
+    """Hold an exclusive lock on the dedicated history lockfile (no-op without fcntl)."""
+    if not HAS_FCNTL:
+        logger.warning("File locking unavailable (Windows) - concurrent writes may corrupt data")
+        yield
+        return
+
+    lock_fd = os.open(HISTORY_LOCKFILE, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        logger.debug(f"Acquired exclusive lock on {HISTORY_FILE}")
+        yield
+    finally:
         try:
-            with open("tracking_history.json", "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
-    return []
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        finally:
+            os.close(lock_fd)
+            logger.debug(f"Released lock on {HISTORY_FILE}")
 
-def save_history(history, dry_run=False):
+def _index_records(records, history):
+    """Fold history records into ``history`` ({tracking_number: added_at}); first record wins."""
+    for item in records:
+        tracking_number = item.get('tracking_number')
+        if tracking_number is not None and tracking_number not in history:
+            history[tracking_number] = item.get('added_at')
+
+def load_history():
+    """Read the tracking history as {tracking_number: added_at}.
+
+    Reads the JSONL file, or the legacy JSON array file if that is all there
+    is. Duplicate records for a tracking number collapse to the earliest one.
     """
-    Save tracking history to file with atomic write and file locking.
+    history = {}
+    if os.path.exists(HISTORY_FILE):
+        # Binary mode: json/orjson parse the UTF-8 bytes directly, skipping text decoding
+        with open(HISTORY_FILE, "rb") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    _index_records((_json_loads(line),), history)
+                except ValueError:  # JSONDecodeError, or a torn multi-byte character
+                    # A crash mid-append can leave a torn last line; keep everything else
+                    logger.warning(f"Skipping corrupt line {line_number} in {HISTORY_FILE}")
+        return history
 
-    Uses a temporary file + atomic rename to prevent corruption,
-    and file locking to prevent concurrent writes.
+    if os.path.exists(LEGACY_HISTORY_FILE):
+        try:
+            with open(LEGACY_HISTORY_FILE, "rb") as f:
+                _index_records(_json_loads(f.read()), history)
+        except ValueError:
+            pass
+    return history
+
+def load_tracking_numbers():
+    """Return the set of already-synced tracking numbers (to claim new ones into)."""
+    return set(load_history())
+
+def _added_before(added_at, cutoff):
+    """Whether a history ``added_at`` timestamp is before ``cutoff``; unparseable ones never are."""
+    try:
+        added = _parse_timestamp(added_at)
+    except (AttributeError, TypeError, ValueError):
+        return False
+    if added.tzinfo is None:
+        added = added.replace(tzinfo=timezone.utc)
+    return added < cutoff
+
+def prune_history(ttl_days=None, dry_run=False):
+    """Evict history entries added more than ``ttl_days`` ago and compact the file.
+
+    The file is only rewritten when something was evicted, so most runs stay
+    read-only. A failed rewrite is logged and the pruned view is still returned.
 
     Args:
-        history: List of tracking history dicts
-        dry_run: If True, only log what would be saved
+        ttl_days: Age limit in days (default: HISTORY_TTL_DAYS; 0 disables eviction).
+            Raised to MAX_SHIPMENT_AGE_DAYS + 1 if lower, so nothing is forgotten
+            while its shipment could still be synced again
+        dry_run: If True, only log what would be evicted
 
     Returns:
-        bool: True if successful
+        {tracking_number: added_at} of the entries that remain
     """
-    if dry_run:
-        logger.info(f"[DRY-RUN] Would save {len(history)} items to tracking_history.json")
-        return True
+    if ttl_days is None:
+        ttl_days = HISTORY_TTL_DAYS
+
+    with _history_file_lock():
+        history = load_history()
+        if ttl_days <= 0:
+            return history
+        min_ttl_days = MAX_SHIPMENT_AGE_DAYS + 1
+        if ttl_days < min_ttl_days:
+            logger.warning(
+                f"HISTORY_TTL_DAYS={ttl_days} would forget shipments that still pass the "
+                f"{MAX_SHIPMENT_AGE_DAYS}-day age filter; using {min_ttl_days} days"
+            )
+            ttl_days = min_ttl_days
 
-    history_file = "tracking_history.json"
-    lockfile = ".tracking_history.lock"
+        cutoff = datetime.now(timezone.utc) - timedelta(days=ttl_days)
+        kept = {
+            tracking_number: added_at
+            for tracking_number, added_at in history.items()
+            if not _added_before(added_at, cutoff)
+        }
+        evicted = len(history) - len(kept)
+        if not evicted:
+            return history
 
-    lock_fd = None
+        if dry_run:
+            logger.info(f"[DRY-RUN] Would evict {evicted} history entries older than {ttl_days} days")
+            return kept
+        try:
+            _write_history_file(kept)
+            logger.info(f"Evicted {evicted} history entries older than {ttl_days} days ({len(kept)} remain)")
+        except Exception as e:
+            logger.error(f"Error compacting history: {e}")
+    return kept
+
+def _write_history_file(history):
+    """Atomically replace HISTORY_FILE with ``history`` ({tracking_number: added_at}; caller holds the lock)."""
+    # Create temp file in same directory for atomic rename
+    temp_fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(HISTORY_FILE) or '.',
+        prefix='.tracking_history_',
+        suffix='.tmp'
+    )
     try:
-        # Acquire exclusive lock on dedicated lockfile to prevent concurrent writes
-        # This locks the target file, not the temp file, preventing race conditions
-        if HAS_FCNTL:
-            lock_fd = os.open(lockfile, os.O_CREAT | os.O_RDWR, 0o644)
-            fcntl.flock(lock_fd, fcntl.LOCK_EX)
-            logger.debug("Acquired exclusive lock on tracking_history.json")
-        else:
-            logger.warning("File locking unavailable (Windows) - concurrent writes may corrupt data")
+        with os.fdopen(temp_fd, 'wb') as f:
+            for tracking_number, added_at in history.items():
+                f.write(_json_dumps({'tracking_number': tracking_number, 'added_at': added_at}) + b"\n")
+            # Make the data durable before the rename can expose it
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Atomic rename (replaces existing file, on Windows too); the lockfile lock
+        # still serializes this against concurrent appends and migrations
+        os.replace(temp_path, HISTORY_FILE)
+    except Exception:
+        # Clean up temp file on error
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
 
-        # Create temp file in same directory for atomic rename
-        temp_fd, temp_path = tempfile.mkstemp(
-            dir=os.path.dirname(history_file) or '.',
-            prefix='.tracking_history_',
-            suffix='.tmp'
-        )
+def append_history(entries, dry_run=False):
+    """
+    Append new tracking history entries, one JSON object per line.
 
-        try:
-            # Write to temp file
-            with os.fdopen(temp_fd, 'w') as f:
-                json.dump(history, f, indent=2)
-
-            # Atomic rename (replaces existing file)
-            # Protected by lockfile lock, so no race condition
-            os.rename(temp_path, history_file)
-            logger.debug(f"Successfully saved {len(history)} items to {history_file}")
-            return True
+    Cost is O(new entries) rather than re-serializing the whole history.
+    On the first write after upgrading, records from the legacy
+    tracking_history.json are carried over into the JSONL file.
 
-        except Exception as e:
-            # Clean up temp file on error
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-            raise
+    Args:
+        entries: List of new tracking history dicts
+        dry_run: If True, only log what would be appended
 
-        finally:
-            # Release lock
-            if HAS_FCNTL and lock_fd is not None:
-                try:
-                    fcntl.flock(lock_fd, fcntl.LOCK_UN)
-                    os.close(lock_fd)
-                    logger.debug("Released lock on tracking_history.json")
-                except:
-                    pass
+    Returns:
+        bool: True if successful
+    """
+    if dry_run:
+        logger.info(f"[DRY-RUN] Would append {len(entries)} items to {HISTORY_FILE}")
+        return True
 
+    try:
+        with _history_file_lock():
+            if not os.path.exists(HISTORY_FILE) and os.path.exists(LEGACY_HISTORY_FILE):
+                legacy = load_history()
+                _write_history_file(legacy)
+                logger.info(f"Migrated {len(legacy)} items from {LEGACY_HISTORY_FILE} to {HISTORY_FILE}")
+
+            with open(HISTORY_FILE, "ab") as f:
+                f.write(b"".join(_json_dumps(item) + b"\n" for item in entries))
+                f.flush()
+                os.fsync(f.fileno())
+        logger.debug(f"Appended {len(entries)} items to {HISTORY_FILE}")
+        return True
     except Exception as e:
         logger.error(f"Error saving history: {e}")
         return False
 
+# Common eBay shipment status values, checked by set membership before falling
+# back to a case-insensitive substring scan for anything unrecognised
+_DELIVERED_STATUSES = frozenset({'Delivered', 'delivered', 'DELIVERED'})
+_UNDELIVERED_STATUSES = frozenset({'Created', 'DroppedOff', 'InTransit', 'Rejected', 'Shipped'})
+
+def _is_delivered_status(status):
+    """Whether a DeliveryStatus/Status value means the package was delivered."""
+    if not status:
+        return False
+    if isinstance(status, str):
+        if status in _DELIVERED_STATUSES:
+            return True
+        if status in _UNDELIVERED_STATUSES:
+            return False
+    return 'delivered' in str(status).casefold()
+
+def _is_delivered(status, delivered_time):
+    """Whether a shipment or tracking entry is delivered, by delivery date or status."""
+    return bool(delivered_time) or _is_delivered_status(status)
+
+def _listify(value):
+    """Normalize an XML-derived field to a list: one element comes back bare, none as None/{}."""
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
+
 def _delivered_tracking_numbers(order):
     """Collect tracking numbers already marked delivered via shipment details."""
     delivered = set()
-    shipments = order.get('ShipmentArray', {}).get('Shipment', [])
-    if isinstance(shipments, dict):
-        shipments = [shipments]
-
-    for shipment in shipments:
-        shipment_status = shipment.get('Status')
-        shipment_delivered_time = shipment.get('ActualDeliveryDate') or shipment.get('DeliveryDate')
-        shipment_marked_delivered = False
-        if shipment_status and 'delivered' in str(shipment_status).lower():
-            shipment_marked_delivered = True
-        if shipment_delivered_time:
-            shipment_marked_delivered = True
-
-        tracking_details = shipment.get('ShipmentTrackingDetails') or []
-        if isinstance(tracking_details, dict):
-            tracking_details = [tracking_details]
-
-        for tracking in tracking_details:
+    for shipment in _listify((order.get('ShipmentArray') or {}).get('Shipment')):
+        shipment_marked_delivered = _is_delivered(
+            shipment.get('Status'),
+            shipment.get('ActualDeliveryDate') or shipment.get('DeliveryDate')
+        )
+
+        for tracking in _listify(shipment.get('ShipmentTrackingDetails')):
             tracking_number = tracking.get('ShipmentTrackingNumber')
             if not tracking_number:
                 continue
 
-            delivered_flag = shipment_marked_delivered
-            delivery_status = tracking.get('DeliveryStatus') or tracking.get('Status')
-            delivered_time = tracking.get('ActualDeliveryDate') or tracking.get('DeliveryDate')
-            if delivery_status and 'delivered' in str(delivery_status).lower():
-                delivered_flag = True
-            if delivered_time:
-                delivered_flag = True
-
-            if delivered_flag:
+            if shipment_marked_delivered or _is_delivered(
+                tracking.get('DeliveryStatus') or tracking.get('Status'),
+                tracking.get('ActualDeliveryDate') or tracking.get('DeliveryDate')
+            ):
                 delivered.add(tracking_number)
 
     return delivered
 
-def extract_tracking_info(orders):
-    """Extract tracking numbers and carrier info from orders, skipping delivered/old shipments."""
-    shipments = []
-    delivered_skipped = 0
-    aged_skipped = 0
-    max_age_days = int(os.getenv("MAX_SHIPMENT_AGE_DAYS", "45"))
-    
-    if not orders or 'OrderArray' not in orders or not orders['OrderArray']:
-        return shipments, delivered_skipped, aged_skipped
-        
-    order_list = orders['OrderArray'].get('Order', [])
-    if isinstance(order_list, dict):
-        order_list = [order_list]
-        
+def _parse_timestamp(timestamp):
+    """Parse an ISO 8601 timestamp (``Z`` suffix allowed); raises ValueError if malformed."""
+    if HAS_CISO8601:
+        return ciso8601.parse_datetime(timestamp)
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+def _is_older_than(timestamp, cutoff, cutoff_iso):
+    """Whether an eBay timestamp falls on or before ``cutoff``.
+
+    eBay's canonical UTC form (``YYYY-MM-DDTHH:MM:SS.sssZ``) orders
+    lexicographically, so the seconds prefix is compared against ``cutoff_iso``
+    as a string and only same-second or non-canonical values are parsed.
+    Unparseable timestamps are treated as not old.
+    """
+    if len(timestamp) >= 20 and timestamp[10] == 'T' and timestamp[-1] == 'Z':
+        head = timestamp[:19]
+        if head < cutoff_iso:
+            return True
+        if head > cutoff_iso:
+            return False
+    try:
+        return _parse_timestamp(timestamp) <= cutoff
+    except Exception:
+        return False
+
+def iter_tracking_info(orders, stats=None, max_age_days=None, known_tracking=frozenset(), now=None):
+    """Lazily yield shipment dicts from a GetOrders payload, skipping delivered/old shipments.
+
+    Args:
+        orders: GetOrders response dict (as returned by EbayClient.get_recent_orders)
+            or an iterable of order dicts (as yielded by EbayClient.iter_orders)
+        stats: Optional dict; 'orders' (walked), 'delivered', 'aged' and 'known'
+            (skipped) counters are accumulated into it
+        max_age_days: Age limit in days (default: MAX_SHIPMENT_AGE_DAYS)
+        known_tracking: Tracking numbers to skip (already synced) before any
+            further per-shipment work
+        now: Reference time for the age check (default: current UTC time)
+
+    Yields:
+        {'tracking_number', 'carrier', 'description'} dicts
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('orders', 0)
+    stats.setdefault('delivered', 0)
+    stats.setdefault('aged', 0)
+    stats.setdefault('known', 0)
+
+    if isinstance(orders, dict):
+        if not orders.get('OrderArray'):
+            return
+        order_list = _listify(orders['OrderArray'].get('Order'))
+    else:
+        order_list = orders or ()
+
+    if max_age_days is None:
+        max_age_days = MAX_SHIPMENT_AGE_DAYS
+    if now is None:
+        now = datetime.now(timezone.utc)
+    # An order is too old once it is a full day past max_age_days
+    cutoff = now - timedelta(days=max_age_days + 1)
+    cutoff_iso = cutoff.strftime("%Y-%m-%dT%H:%M:%S")
+
     for order in order_list:
+        stats['orders'] += 1
+        get = order.get
         # Approximate age to avoid pushing very old (likely delivered) shipments
-        order_time_str = order.get('ShippedTime') or order.get('PaidTime') or order.get('CreatedTime')
-        if order_time_str:
-            try:
-                # eBay uses ISO-like with Z
-                order_time = datetime.fromisoformat(order_time_str.replace('Z', '+00:00'))
-                if (datetime.now(timezone.utc) - order_time).days > max_age_days:
-                    aged_skipped += 1
-                    continue
-            except Exception:
-                pass
+        order_time_str = get('ShippedTime') or get('PaidTime') or get('CreatedTime')
+        if order_time_str and _is_older_than(order_time_str, cutoff, cutoff_iso):
+            stats['aged'] += 1
+            continue
+
+        shipping_details = get('ShippingDetails')
+        if shipping_details is None:
+            continue
 
         delivered_numbers = _delivered_tracking_numbers(order)
 
-        # Check for shipping details
-        if 'ShippingDetails' in order:
-            shipping_details = order['ShippingDetails']
-            tracking_details = shipping_details.get('ShipmentTrackingDetails') or []
-            # Some responses use ShipmentLineItemArray.Transaction.ShippingDetails.ShipmentTrackingDetails
-            if not tracking_details:
-                txns = order.get('TransactionArray', {}).get('Transaction', [])
-                if isinstance(txns, dict):
-                    txns = [txns]
-                for txn in txns:
-                    sd = txn.get('ShippingDetails', {})
-                    td = sd.get('ShipmentTrackingDetails') or []
-                    if td:
-                        tracking_details = td
-                        break
+        tracking_details = shipping_details.get('ShipmentTrackingDetails') or []
+        # Some responses use ShipmentLineItemArray.Transaction.ShippingDetails.ShipmentTrackingDetails
+        if not tracking_details:
+            for txn in _listify((get('TransactionArray') or {}).get('Transaction')):
+                td = (txn.get('ShippingDetails') or {}).get('ShipmentTrackingDetails')
+                if td:
+                    tracking_details = td
+                    break
+
+        title = None
+        for tracking in _listify(tracking_details):
+            tracking_get = tracking.get
+            tracking_number = tracking_get('ShipmentTrackingNumber')
+            carrier = tracking_get('ShippingCarrierUsed') or tracking_get('ShippingCarrierCode')
+
+            # Skip already delivered shipments based on status or delivery date
+            if tracking_number in delivered_numbers or _is_delivered(
+                tracking_get('DeliveryStatus') or tracking_get('Status'),
+                tracking_get('ActualDeliveryDate') or tracking_get('DeliveryDate')
+            ):
+                stats['delivered'] += 1
+                continue
 
-            if isinstance(tracking_details, dict):
-                tracking_details = [tracking_details]
+            if not tracking_number:
+                continue
+            if tracking_number in known_tracking:
+                stats['known'] += 1
+                continue
 
-            for tracking in tracking_details:
-                tracking_number = tracking.get('ShipmentTrackingNumber')
-                carrier = tracking.get('ShippingCarrierUsed') or tracking.get('ShippingCarrierCode')
-                
-                # Skip already delivered shipments based on status or delivery date
-                delivered_flag = False
-                if tracking_number in delivered_numbers:
-                    delivered_flag = True
-                else:
-                    delivery_status = tracking.get('DeliveryStatus') or tracking.get('Status')
-                    delivered_time = tracking.get('ActualDeliveryDate') or tracking.get('DeliveryDate')
-                    if delivery_status:
-                        delivered_flag = 'delivered' in str(delivery_status).lower()
-                    if delivered_time:
-                        delivered_flag = True
-                if delivered_flag:
-                    delivered_skipped += 1
-                    continue
-                
-                # Get item title for description
+            # Item title for description, resolved once per order
+            if title is None:
                 title = "eBay Item"
-                if 'TransactionArray' in order and 'Transaction' in order['TransactionArray']:
-                    transactions = order['TransactionArray']['Transaction']
-                    if isinstance(transactions, dict):
-                        transactions = [transactions]
-                    if transactions:
-                        title = transactions[0].get('Item', {}).get('Title', 'eBay Item')
-                        # Truncate title if too long
-                        if len(title) > 30:
-                            title = title[:27] + "..."
-
-                if tracking_number:
-                    shipments.append({
-                        'tracking_number': tracking_number,
-                        'carrier': carrier,
-                        'description': title
-                    })
-                    
-    return shipments, delivered_skipped, aged_skipped
+                transactions = _listify((get('TransactionArray') or {}).get('Transaction'))
+                if transactions:
+                    title = (transactions[0].get('Item') or {}).get('Title') or 'eBay Item'
+                    # Truncate title if too long
+                    if len(title) > 30:
+                        title = title[:27] + "..."
+
+            yield {
+                'tracking_number': tracking_number,
+                'carrier': carrier,
+                'description': title
+            }
+
+def extract_tracking_info(orders, max_age_days=None, known_tracking=frozenset(), now=None):
+    """Extract tracking numbers and carrier info from orders, skipping delivered/old/known shipments.
+
+    Returns:
+        (shipments list, delivered_skipped, aged_skipped)
+    """
+    stats = {}
+    shipments = list(iter_tracking_info(orders, stats, max_age_days=max_age_days,
+                                        known_tracking=known_tracking, now=now))
+    return shipments, stats['delivered'], stats['aged']
+
+def _carrier_code(carrier):
+    """Map an eBay carrier name to a Parcel carrier code.
+
+    Unrecognized names are passed through unchanged; a missing carrier
+    becomes the 'pholder' placeholder.
+    """
+    match = _CARRIER_RE.search(carrier or "")
+    if match:
+        return _CARRIER_CODES[match.group(1).upper()]
+    return carrier or _UNKNOWN_CARRIER_CODE
+
 
 def _account_suffixes():
-    """Collect configured account suffixes: default, then _2, _3, ..."""
+    """Collect configured account suffixes: default, then _2, _3, ...
+
+    A suffix whose app ID and refresh token repeat an earlier account's is
+    dropped: it is the same eBay buyer, so its GetOrders call would fetch the
+    exact same orders a second time.
+    """
     suffixes = []
+    seen_credentials = set()
+
+    def add(suffix):
+        env = _ebay_env(suffix)
+        credentials = (env["EBAY_APP_ID"], env["EBAY_REFRESH_TOKEN"])
+        if credentials[1] and credentials in seen_credentials:
+            logger.warning(f"EBAY_*_{suffix} duplicates an earlier account's credentials; skipping it")
+            return
+        seen_credentials.add(credentials)
+        suffixes.append(suffix)
+
     if os.getenv('EBAY_APP_ID'):
-        suffixes.append("")
+        add("")
     # Numeric suffixes starting at 2 (EBAY_APP_ID_2, EBAY_APP_ID_3, ...)
     i = 2
     while True:
         if os.getenv(f'EBAY_APP_ID_{i}'):
-            suffixes.append(str(i))
+            add(str(i))
             i += 1
             continue
         break
     return suffixes
 
 
-def process_account(suffix: str, history, history_tracking_numbers, days_back: int = 90, dry_run: bool = False):
+def process_account(suffix: str, history: list, history_tracking_numbers: set, days_back: int = 90, dry_run: bool = False, parcel=None, use_cache: bool = True):
+    """Sync one eBay account's new shipments to Parcel.
+
+    Safe to run concurrently for different suffixes: token refresh is serialized,
+    tracking numbers are claimed in ``history_tracking_numbers`` and successful
+    uploads appended to ``history`` (the records to persist) under
+    ``_history_lock``. Pass a shared ``parcel`` client so
+    all accounts draw on one connection pool and one rate-limit budget.
+    """
     label = f"default" if not suffix else f"account {suffix}"
     logger.info(f"[{label}] Initializing clients...")
     try:
-        ebay = EbayClient(suffix=suffix)
-        parcel = ParcelClient(dry_run=dry_run)
+        # shared_ebay may rewrite .env while refreshing, so keep refreshes one at a time
+        with _token_lock:
+            ebay = EbayClient(suffix=suffix)
+        if parcel is None:
+            parcel = ParcelClient(dry_run=dry_run)
     except Exception as e:
         logger.critical(f"[{label}] Initialization failed: {e}")
         return 0
@@ -413,77 +1214,70 @@ def process_account(suffix: str, history, history_tracking_numbers, days_back: i
         return 0
 
     logger.info(f"[{label}] Fetching recent orders from eBay (last {days_back} days)...")
-    orders = ebay.get_recent_orders(days_back=days_back)
-    
-    if not orders:
-        logger.info(f"[{label}] No orders found or error fetching orders.")
+
+    def unclaimed(shipments):
+        for shipment in shipments:
+            tracking_number = shipment['tracking_number']
+            # Claim the number so neither this nor a concurrently running account re-sends it
+            with _history_lock:
+                if tracking_number in history_tracking_numbers:
+                    claimed = False
+                else:
+                    history_tracking_numbers.add(tracking_number)
+                    claimed = True
+            if not claimed:
+                logger.debug(f"[{label}] Skipping existing tracking number: {tracking_number}")
+                continue
+            yield shipment
+
+    max_per_run = PARCEL_MAX_PER_RUN
+    pending = []
+
+    # Extraction and paging are lazy: GetOrders pages more than EBAY_MAX_CONCURRENCY
+    # past the one holding the PARCEL_MAX_PER_RUN-th new shipment are never requested
+    stats = {'orders': 0, 'delivered': 0, 'aged': 0, 'known': 0}
+    orders = ebay.iter_orders(days_back=days_back, use_cache=use_cache)
+    try:
+        # The known_tracking pre-check is an unlocked fast path; unclaimed() makes the authoritative claim
+        shipments = iter_tracking_info(orders, stats, known_tracking=history_tracking_numbers)
+        for shipment in itertools.islice(unclaimed(shipments), max_per_run):
+            pending.append((shipment['tracking_number'], _carrier_code(shipment.get('carrier')), shipment['description']))
+    except Exception as e:
+        # Keep whatever earlier pages produced; those numbers are already claimed
+        logger.error(f"[{label}] Error fetching orders: {e}")
+        if not pending:
+            return 0
+    finally:
+        # All eBay calls are done (stop any pages still being prefetched); only Parcel uploads remain
+        orders.close()
+        ebay.close()
+
+    if not stats['orders']:
+        logger.info(f"[{label}] No orders found.")
         return 0
-    
-    order_list = orders.get('OrderArray', {}).get('Order', [])
-    if isinstance(order_list, dict):
-        order_list = [order_list]
-    logger.info(f"[{label}] Processing {len(order_list)} orders for tracking extraction")
-
-    shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
-    total_with_tracking = len(shipments) + delivered_skipped + aged_skipped
+
+    capped = len(pending) >= max_per_run
     logger.info(
-        f"[{label}] Found {total_with_tracking} shipments with tracking info "
-        f"(skipped {delivered_skipped} delivered, {aged_skipped} older than MAX_SHIPMENT_AGE_DAYS)."
+        f"[{label}] Queued {len(pending)} new shipments from {stats['orders']} orders "
+        f"(skipped {stats['known']} already synced, {stats['delivered']} delivered, "
+        f"{stats['aged']} older than MAX_SHIPMENT_AGE_DAYS"
+        f"{' before reaching PARCEL_MAX_PER_RUN=' + str(max_per_run) if capped else ''})."
     )
 
-    new_shipments_count = 0
-    history_set = set(history_tracking_numbers)
-    run_seen = set()
-    max_per_run = int(os.getenv("PARCEL_MAX_PER_RUN", "20"))
-    attempts = 0
-    
-    for shipment in shipments:
-        tracking_number = shipment['tracking_number']
-        if tracking_number in history_set or tracking_number in run_seen:
-            logger.debug(f"[{label}] Skipping existing tracking number: {tracking_number}")
-            continue
-        run_seen.add(tracking_number)
-        if attempts >= max_per_run:
-            logger.info(f"[{label}] Reached PARCEL_MAX_PER_RUN={max_per_run}; stopping further requests.")
-            break
-            
-        carrier_code = shipment.get('carrier', 'pholder') 
-        
-        carrier_map = {
-            'USPS': 'usps',
-            'UPS': 'ups',
-            'FedEx': 'fedex',
-            'DHL': 'dhl',
-            'Amazon': 'amazon-logistics'
-        }
-        
-        normalized_carrier = carrier_code.upper() if carrier_code else ""
-        for key, value in carrier_map.items():
-            if key in normalized_carrier:
-                carrier_code = value
-                break
-        
-        success, rate_limited = parcel.add_delivery(
-            tracking_number=tracking_number,
-            carrier_code=carrier_code,
-            description=shipment['description']
-        )
-        attempts += 1
-        
-        if rate_limited:
-            logger.error(f"[{label}] Hit Parcel rate limit; stopping further requests for this run.")
-            break
+    if pending and parcel.halted:
+        logger.error(f"[{label}] Parcel rate limit already reached this run; skipping {len(pending)} shipments.")
+        return 0
 
-        if success:
-            history.append({
-                'tracking_number': tracking_number,
-                'added_at': datetime.now(timezone.utc).isoformat()
-            })
-            history_set.add(tracking_number)
-            history_tracking_numbers.append(tracking_number)
-            new_shipments_count += 1
-            
-    return new_shipments_count
+    added, rate_limited = parcel.add_deliveries(pending)
+    if rate_limited:
+        logger.error(f"[{label}] Hit Parcel rate limit; stopping further requests for this run.")
+
+    # One timestamp for the batch; the uploads finished moments apart
+    added_at = datetime.now(timezone.utc).isoformat()
+    with _history_lock:
+        history.extend({'tracking_number': tracking_number, 'added_at': added_at} for tracking_number in added)
+
+    return len(added)
 
 
 def main():
@@ -495,6 +1289,7 @@ Examples:
   %(prog)s                    # Normal mode: sync shipments to Parcel
   %(prog)s --dry-run          # Dry-run: show what would be synced without making API calls
   %(prog)s --days-back 30     # Only sync shipments from last 30 days
+  %(prog)s --no-cache         # Ignore orders cached by a run in the last 15 minutes
 
 Environment Variables:
   EBAY_APP_ID                 # eBay App ID (required)
@@ -502,6 +1297,16 @@ Environment Variables:
   EBAY_USER_TOKEN             # eBay User Token (required)
   PARCEL_API_KEY              # Parcel API Key (required unless --dry-run)
   MAX_SHIPMENT_AGE_DAYS       # Max age for shipments (default: 45)
+  PARCEL_MAX_PER_RUN          # Max new shipments per account per run (default: 20)
+  PARCEL_CONCURRENCY          # Max Parcel requests in flight (default: 4)
+  PARCEL_MAX_RETRIES          # Retries per shipment after a 429 (default: 3)
+  PARCEL_BACKOFF_BASE         # Base seconds for 429 backoff without Retry-After (default: 1.0)
+  PARCEL_LATENCY_TARGET_SEC   # Slower Parcel responses halve concurrency (default: 2.0)
+  EBAY_MAX_CONCURRENCY        # Parallel GetOrders page fetches (default: 5)
+  EBAY_CACHE_TTL_SEC          # Seconds to reuse fetched orders (default: 900)
+  HISTORY_TTL_DAYS            # Days to remember synced tracking numbers (default: 180)
+
+Run-wide settings are read once at startup (after .env is loaded).
         """
     )
     parser.add_argument(
@@ -515,6 +1320,11 @@ Environment Variables:
         default=90,
         help='Number of days back to fetch orders (default: 90)'
     )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always fetch orders from eBay instead of reusing a recent fetch (see EBAY_CACHE_TTL_SEC)'
+    )
 
     args = parser.parse_args()
 
@@ -526,27 +1336,41 @@ Environment Variables:
     else:
         print("Starting eBay2Parcel...")
 
-    history = load_history()
-    history_tracking_numbers = [item['tracking_number'] for item in history]
+    history_tracking_numbers = set(prune_history(dry_run=args.dry_run))
+    # Only this run's additions are kept in memory; they are appended to the file at the end
+    new_entries = []
 
     suffixes = _account_suffixes()
     if not suffixes:
         logger.critical("No EBAY_APP_ID configured in environment")
         return
 
+    parcel = ParcelClient(dry_run=args.dry_run)
+
+    # Accounts are independent, so their (slow) GetOrders calls and uploads overlap
     total_added = 0
-    for suffix in suffixes:
-        added = process_account(
-            suffix,
-            history,
-            history_tracking_numbers,
-            days_back=args.days_back,
-            dry_run=args.dry_run
-        )
-        total_added += added
+    try:
+        with ThreadPoolExecutor(max_workers=len(suffixes)) as executor:
+            futures = [
+                executor.submit(
+                    process_account,
+                    suffix,
+                    new_entries,
+                    history_tracking_numbers,
+                    days_back=args.days_back,
+                    dry_run=args.dry_run,
+                    parcel=parcel,
+                    use_cache=not args.no_cache
+                )
+                for suffix in suffixes
+            ]
+            for future in futures:
+                total_added += future.result()
+    finally:
+        parcel.close()
 
     if total_added > 0:
-        if save_history(history, dry_run=args.dry_run):
+        if append_history(new_entries, dry_run=args.dry_run):
             if args.dry_run:
                 logger.info(f"[DRY-RUN] Would add {total_added} new shipments to Parcel across all accounts.")
             else:
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Populate tracking_history.json with all tracking numbers from eBay
+Populate tracking_history.jsonl with all tracking numbers from eBay
 without adding them to Parcel. This prevents re-adding items you've deleted.
 """
 
@@ -8,7 +8,7 @@ import os
 import json
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from main import EbayClient, load_history, save_history, _account_suffixes
+from main import EbayClient, load_tracking_numbers, append_history, _account_suffixes, _listify, HISTORY_FILE
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,11 +23,7 @@ def extract_all_tracking_numbers(orders):
     if not orders or 'OrderArray' not in orders or not orders['OrderArray']:
         return tracking_numbers
 
-    order_list = orders['OrderArray'].get('Order', [])
-    if isinstance(order_list, dict):
-        order_list = [order_list]
-
-    for order in order_list:
+    for order in _listify(orders['OrderArray'].get('Order')):
         # Check ShippingDetails
         if 'ShippingDetails' in order:
             shipping_details = order['ShippingDetails']
@@ -35,35 +31,20 @@ def extract_all_tracking_numbers(orders):
 
             # Also check transactions
             if not tracking_details:
-                txns = order.get('TransactionArray', {}).get('Transaction', [])
-                if isinstance(txns, dict):
-                    txns = [txns]
-                for txn in txns:
-                    sd = txn.get('ShippingDetails', {})
-                    td = sd.get('ShipmentTrackingDetails') or []
+                for txn in _listify((order.get('TransactionArray') or {}).get('Transaction')):
+                    td = (txn.get('ShippingDetails') or {}).get('ShipmentTrackingDetails')
                     if td:
                         tracking_details = td
                         break
 
-            if isinstance(tracking_details, dict):
-                tracking_details = [tracking_details]
-
-            for tracking in tracking_details:
+            for tracking in _listify(tracking_details):
                 tracking_number = tracking.get('ShipmentTrackingNumber')
                 if tracking_number:
                     tracking_numbers.add(tracking_number)
 
         # Check ShipmentArray
-        shipments = order.get('ShipmentArray', {}).get('Shipment', [])
-        if isinstance(shipments, dict):
-            shipments = [shipments]
-
-        for shipment in shipments:
-            tracking_details = shipment.get('ShipmentTrackingDetails') or []
-            if isinstance(tracking_details, dict):
-                tracking_details = [tracking_details]
-
-            for tracking in tracking_details:
+        for shipment in _listify((order.get('ShipmentArray') or {}).get('Shipment')):
+            for tracking in _listify(shipment.get('ShipmentTrackingDetails')):
                 tracking_number = tracking.get('ShipmentTrackingNumber')
                 if tracking_number:
                     tracking_numbers.add(tracking_number)
@@ -71,10 +52,9 @@ def extract_all_tracking_numbers(orders):
     return tracking_numbers
 
 def main():
-    print("Populating tracking_history.json with all eBay tracking numbers...")
+    print(f"Populating {HISTORY_FILE} with all eBay tracking numbers...")
 
-    history = load_history()
-    existing_tracking_numbers = {item['tracking_number'] for item in history}
+    existing_tracking_numbers = load_tracking_numbers()
 
     suffixes = _account_suffixes()
     if not suffixes:
@@ -104,25 +84,22 @@ def main():
         all_tracking_numbers.update(tracking_numbers)
 
     # Add new tracking numbers to history
-    new_count = 0
     current_time = datetime.now(timezone.utc).isoformat()
-
-    for tracking_number in all_tracking_numbers:
-        if tracking_number not in existing_tracking_numbers:
-            history.append({
-                'tracking_number': tracking_number,
-                'added_at': current_time
-            })
-            new_count += 1
+    new_entries = [
+        {'tracking_number': tracking_number, 'added_at': current_time}
+        for tracking_number in all_tracking_numbers
+        if tracking_number not in existing_tracking_numbers
+    ]
+    new_count = len(new_entries)
 
     if new_count > 0:
-        save_history(history)
+        append_history(new_entries)
         logger.info(f"Added {new_count} new tracking numbers to cache")
-        logger.info(f"Total tracking numbers in cache: {len(history)}")
+        logger.info(f"Total tracking numbers in cache: {len(existing_tracking_numbers) + new_count}")
     else:
         logger.info("All tracking numbers already in cache")
 
-    print("\nDone! All eBay tracking numbers are now in tracking_history.json")
+    print(f"\nDone! All eBay tracking numbers are now in {HISTORY_FILE}")
     print("This prevents them from being re-added to Parcel if you delete them.")
 
 if __name__ == "__main__":
@@ -2,7 +2,27 @@ import unittest
 from unittest.mock import MagicMock, patch
 import json
 import os
-from main import extract_tracking_info, ParcelClient, EbayClient
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+import requests
+from requests.adapters import BaseAdapter
+import main
+from main import extract_tracking_info, process_account, _account_suffixes, ParcelClient, EbayClient, AdaptiveLimiter, _carrier_code, _make_trading
+
+
+def _resp(status, payload=None, text='', headers=None):
+    """Canned requests.Response; json() raises when there is no JSON body."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(payload).encode() if payload is not None else text.encode()
+    response.headers.update(headers or {})
+    return response
+
+
+EBAY_ENV = {'EBAY_APP_ID': 'app-id', 'EBAY_CLIENT_SECRET': 'secret', 'EBAY_DEV_ID': 'dev-id'}
 
 class TesteBay2Parcel(unittest.TestCase):
 
@@ -44,13 +64,11 @@ class TesteBay2Parcel(unittest.TestCase):
         }
         
         shipments, delivered_skipped, aged_skipped = extract_tracking_info(mock_orders)
-        self.assertEqual(len(shipments), 2)
-        self.assertEqual(delivered_skipped, 0)
-        self.assertEqual(aged_skipped, 0)
-        self.assertEqual(shipments[0]['tracking_number'], '1234567890')
-        self.assertEqual(shipments[0]['carrier'], 'USPS')
-        self.assertEqual(shipments[1]['tracking_number'], '0987654321')
-        self.assertEqual(shipments[1]['carrier'], 'UPS')
+        self.assertEqual((delivered_skipped, aged_skipped), (0, 0))
+        self.assertEqual(shipments, [
+            {'tracking_number': '1234567890', 'carrier': 'USPS', 'description': 'Test Item 1'},
+            {'tracking_number': '0987654321', 'carrier': 'UPS', 'description': 'Test Item 2'}
+        ])
 
     def test_extract_tracking_info_skips_delivered(self):
         mock_orders = {
@@ -98,98 +116,398 @@ class TesteBay2Parcel(unittest.TestCase):
         self.assertEqual(delivered_skipped, 1)
         self.assertEqual(aged_skipped, 0)
 
-    @patch('main.requests.post')
-    def test_parcel_client_add_delivery_success(self, mock_post):
-        # Mock environment variable
-        with patch.dict(os.environ, {'PARCEL_API_KEY': 'test_key'}):
-            client = ParcelClient()
+    def test_add_deliveries_stops_submitting_after_rate_limit(self):
+        parcel = ParcelClient(dry_run=True)
+        parcel.limiter = AdaptiveLimiter(initial=1, minimum=1)
+        parcel.limiter.on_overload()
 
-            # Mock successful response
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_post.return_value = mock_response
+        items = [('1', 'usps', 'A'), ('2', 'usps', 'B'), ('3', 'usps', 'C')]
+        with patch.object(parcel, 'add_delivery', side_effect=[(True, False), (False, True), (True, False)]) as add:
+            added, rate_limited = parcel.add_deliveries(items, max_workers=1)
 
-            success, rate_limited = client.add_delivery('123', 'usps', 'Test')
-            self.assertTrue(success)
-            self.assertFalse(rate_limited)
+        self.assertEqual(added, ['1'])
+        self.assertTrue(rate_limited)
+        self.assertEqual(add.call_count, 2)
+        self.assertTrue(parcel.halted)
 
-            # Verify API call
-            mock_post.assert_called_once()
-            args, kwargs = mock_post.call_args
-            self.assertEqual(kwargs['json']['tracking_number'], '123')
-            self.assertEqual(kwargs['headers']['api-key'], 'test_key')
+    def test_add_deliveries_requeues_rate_limited_item_while_limiter_backs_off(self):
+        parcel = ParcelClient(dry_run=True)
 
-    @patch('main.requests.post')
-    def test_parcel_client_add_delivery_already_exists(self, mock_post):
-        with patch.dict(os.environ, {'PARCEL_API_KEY': 'test_key'}):
-            client = ParcelClient()
+        with patch.object(parcel, 'add_delivery', side_effect=[(False, True), (True, False)]) as add:
+            added, rate_limited = parcel.add_deliveries([('1', 'usps', 'A')], max_workers=1)
 
-            # Mock 400 response with "already added" error
-            mock_response = MagicMock()
-            mock_response.status_code = 400
-            mock_response.json.return_value = {'error_message': 'Delivery already added'}
-            mock_post.return_value = mock_response
+        self.assertEqual(added, ['1'])
+        self.assertFalse(rate_limited)
+        self.assertEqual(add.call_count, 2)
 
-            success, rate_limited = client.add_delivery('123', 'usps', 'Test')
-            self.assertTrue(success)  # Should treat as success
-            self.assertFalse(rate_limited)
+    def test_add_deliveries_shares_concurrency_limit_across_callers(self):
+        parcel = ParcelClient(dry_run=True)
+        parcel.limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=2)
+        lock = threading.Lock()
+        active = peak = 0
 
-    @patch('main.requests.post')
-    def test_parcel_client_add_delivery_unsupported_carrier(self, mock_post):
-        with patch.dict(os.environ, {'PARCEL_API_KEY': 'test_key'}):
-            client = ParcelClient()
+        def add_delivery(tracking_number, carrier_code, description):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+            return True, False
 
-            # Mock 400 response with unsupported carrier error
-            mock_response = MagicMock()
-            mock_response.status_code = 400
-            mock_response.json.return_value = {'error_message': 'Unsupported carrier'}
-            mock_post.return_value = mock_response
+        results = []
+        def run(prefix):
+            items = [(f'{prefix}{n}', 'usps', 'Test') for n in range(6)]
+            results.append(parcel.add_deliveries(items, max_workers=8))
 
-            success, rate_limited = client.add_delivery('123', 'invalid', 'Test')
-            self.assertFalse(success)
-            self.assertFalse(rate_limited)
+        with patch.object(parcel, 'add_delivery', side_effect=add_delivery):
+            callers = [threading.Thread(target=run, args=(prefix,)) for prefix in 'ab']
+            for caller in callers:
+                caller.start()
+            for caller in callers:
+                caller.join()
 
-    @patch('main.requests.post')
-    def test_parcel_client_add_delivery_rate_limited(self, mock_post):
-        with patch.dict(os.environ, {'PARCEL_API_KEY': 'test_key'}):
-            client = ParcelClient()
+        self.assertLessEqual(peak, 2)
+        self.assertEqual(sorted(len(added) for added, _ in results), [6, 6])
+        self.assertEqual(parcel._in_flight, 0)
 
-            # Mock 429 rate limit response
-            mock_response = MagicMock()
-            mock_response.status_code = 429
-            mock_response.json.return_value = {'error_message': 'Rate limit exceeded'}
-            mock_response.text = 'Rate limit exceeded'
-            mock_post.return_value = mock_response
+    def test_parcel_pool_holds_a_connection_per_worker(self):
+        with patch.object(main, 'PARCEL_CONCURRENCY', 12):
+            client = ParcelClient(dry_run=True)
+        adapter = client._session.get_adapter(client.base_url)
+        self.assertEqual(adapter._pool_maxsize, 12)
 
-            success, rate_limited = client.add_delivery('123', 'usps', 'Test')
-            self.assertFalse(success)
-            self.assertTrue(rate_limited)
+    def test_adaptive_limiter_aimd(self):
+        limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8)
 
-    @patch('main.requests.post')
-    def test_parcel_client_add_delivery_server_error(self, mock_post):
-        with patch.dict(os.environ, {'PARCEL_API_KEY': 'test_key'}):
-            client = ParcelClient()
+        limiter.on_overload()
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(4):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 3)
+
+        limiter.on_overload()
+        limiter.on_overload()
+        self.assertEqual(limiter.limit, 1)
+        self.assertFalse(limiter.exhausted)
+        limiter.on_overload()
+        self.assertTrue(limiter.exhausted)
+
+    def test_adaptive_limiter_slow_response_halves_without_exhausting(self):
+        limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=8)
+
+        limiter.on_slow()
+        self.assertEqual(limiter.limit, 1)
+        limiter.on_slow()
+        self.assertEqual(limiter.limit, 1)
+        self.assertFalse(limiter.exhausted)
+
+    @patch.object(main, 'EbayClient')
+    def test_process_account_skips_known_and_stops_at_cap(self, mock_ebay):
+        mock_ebay.return_value.iter_orders.return_value = (
+            {'ShippingDetails': {'ShipmentTrackingDetails': {'ShipmentTrackingNumber': number}}}
+            for number in ('111', '222', '333')
+        )
+        history = []
+        known = {'111'}
+
+        with patch.object(main, 'PARCEL_MAX_PER_RUN', 1):
+            added = process_account('', history, known, dry_run=True, parcel=ParcelClient(dry_run=True))
+
+        self.assertEqual(added, 1)
+        self.assertEqual([item['tracking_number'] for item in history], ['222'])
+        self.assertNotIn('333', known)
+
+    def test_carrier_code_mapping(self):
+        self.assertEqual(_carrier_code('USPS'), 'usps')
+        self.assertEqual(_carrier_code('FedEx'), 'fedex')
+        self.assertEqual(_carrier_code('Amazon Logistics'), 'amazon-logistics')
+        self.assertEqual(_carrier_code('OnTrac'), 'OnTrac')
+        self.assertEqual(_carrier_code(None), 'pholder')
+
+    def test_account_suffixes_skips_duplicate_credentials(self):
+        env = {
+            'EBAY_APP_ID': 'app', 'EBAY_REFRESH_TOKEN': 'refresh-a',
+            'EBAY_APP_ID_2': 'app', 'EBAY_REFRESH_TOKEN_2': 'refresh-a',
+            'EBAY_APP_ID_3': 'app', 'EBAY_REFRESH_TOKEN_3': 'refresh-b',
+        }
+        with patch.dict(os.environ, env, clear=True):
+            self.assertEqual(_account_suffixes(), ['', '3'])
+
+
+class TestEbayClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Credentials and token checks are the same for every test; only the transport varies
+        for patcher in (patch.dict(os.environ, EBAY_ENV),
+                        patch.object(main, 'get_token_manager'),
+                        patch.object(main, 'ensure_valid_token', return_value=True)):
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        send_patcher = patch.object(requests.Session, 'send')
+        self.mock_send = send_patcher.start()
+        self.addCleanup(send_patcher.stop)
+        # _make_trading memoizes the Trading connection it builds from EBAY_* env;
+        # clear it so a connection built under these credentials can't outlive the class
+        self.addCleanup(_make_trading.cache_clear)
+
+    def test_ebay_client_parses_get_orders_xml(self):
+        self.mock_send.return_value = MagicMock(status_code=200, content=b'''<?xml version="1.0" encoding="UTF-8"?>
+<GetOrdersResponse xmlns="urn:ebay:apis:eBLBaseComponents">
+  <Ack>Success</Ack>
+  <OrderArray><Order><ShippingDetails><ShipmentTrackingDetails>
+    <ShipmentTrackingNumber>123</ShipmentTrackingNumber>
+    <ShippingCarrierUsed>USPS</ShippingCarrierUsed>
+  </ShipmentTrackingDetails></ShippingDetails></Order></OrderArray>
+</GetOrdersResponse>''')
+
+        orders = EbayClient().get_recent_orders(days_back=30, use_cache=False)
+
+        shipments, _, _ = extract_tracking_info(orders)
+        self.assertEqual(shipments[0]['tracking_number'], '123')
+        self.assertEqual(shipments[0]['carrier'], 'USPS')
+
+    def test_ebay_client_keeps_only_tracking_fields(self):
+        self.mock_send.return_value = MagicMock(status_code=200, content=b'''<?xml version="1.0" encoding="UTF-8"?>
+<GetOrdersResponse xmlns="urn:ebay:apis:eBLBaseComponents">
+  <Ack>Success</Ack>
+  <OrderArray><Order>
+    <OrderID>1-2</OrderID>
+    <ShippedTime>2024-01-01T00:00:00.000Z</ShippedTime>
+    <ShippingDetails><SalesTax>0</SalesTax></ShippingDetails>
+    <TransactionArray>
+      <Transaction><Item><ItemID>9</ItemID><Title>Widget</Title></Item></Transaction>
+      <Transaction><Item><Title>Gadget</Title></Item></Transaction>
+    </TransactionArray>
+  </Order></OrderArray>
+</GetOrdersResponse>''')
+
+        orders = list(EbayClient().iter_orders(use_cache=False))
+
+        self.assertEqual(orders, [{
+            'ShippedTime': '2024-01-01T00:00:00.000Z',
+            'ShippingDetails': {},
+            'TransactionArray': {'Transaction': [{'Item': {'Title': 'Widget'}}, {'Item': {'Title': 'Gadget'}}]}
+        }])
+
+    def test_ebay_client_returns_none_on_api_error(self):
+        self.mock_send.return_value = MagicMock(status_code=200, content=b'''<?xml version="1.0" encoding="UTF-8"?>
+<GetOrdersResponse xmlns="urn:ebay:apis:eBLBaseComponents">
+  <Ack>Failure</Ack>
+  <Errors><ShortMessage>Invalid token</ShortMessage><SeverityCode>Error</SeverityCode></Errors>
+</GetOrdersResponse>''')
+
+        self.assertIsNone(EbayClient().get_recent_orders(use_cache=False))
+
+    def test_ebay_client_follows_get_orders_pages(self):
+        page = '''<?xml version="1.0" encoding="UTF-8"?>
+<GetOrdersResponse xmlns="urn:ebay:apis:eBLBaseComponents">
+  <Ack>Success</Ack>
+  <OrderArray><Order><ShippingDetails><ShipmentTrackingDetails>
+    <ShipmentTrackingNumber>{number}</ShipmentTrackingNumber>
+  </ShipmentTrackingDetails></ShippingDetails></Order></OrderArray>
+  <HasMoreOrders>{more}</HasMoreOrders>
+  <PaginationResult><TotalNumberOfPages>3</TotalNumberOfPages></PaginationResult>
+</GetOrdersResponse>'''
+
+        def send(request, **kwargs):
+            number = re.search(rb'<PageNumber>(\d+)</PageNumber>', request.body).group(1).decode()
+            more = 'true' if number != '3' else 'false'
+            return MagicMock(status_code=200, content=page.format(number=number, more=more).encode())
+        self.mock_send.side_effect = send
+
+        orders = list(EbayClient().iter_orders(days_back=30, use_cache=False))
+
+        self.assertEqual(self.mock_send.call_count, 3)
+        shipments, _, _ = extract_tracking_info({'OrderArray': {'Order': orders}})
+        self.assertEqual([s['tracking_number'] for s in shipments], ['1', '2', '3'])
 
-            # Mock 500 server error response
-            mock_response = MagicMock()
-            mock_response.status_code = 500
-            mock_response.json.side_effect = Exception("No JSON")
-            mock_response.text = 'Internal Server Error'
-            mock_post.return_value = mock_response
+    def test_ebay_clients_for_one_account_share_the_build_lock(self):
+        first, second = EbayClient(), EbayClient()
 
-            success, rate_limited = client.add_delivery('123', 'usps', 'Test')
-            self.assertFalse(success)
-            self.assertFalse(rate_limited)
+        self.assertIs(first.api, second.api)
+        self.assertIs(first._build_lock, second._build_lock)
 
-    @patch('main.requests.post')
-    def test_parcel_client_add_delivery_missing_api_key(self, mock_post):
+    def test_ebay_client_reuses_recent_fetch_from_cache(self):
+        self.mock_send.return_value = MagicMock(status_code=200, content=b'''<?xml version="1.0" encoding="UTF-8"?>
+<GetOrdersResponse xmlns="urn:ebay:apis:eBLBaseComponents">
+  <Ack>Success</Ack>
+  <OrderArray><Order><ShippedTime>2024-01-01T00:00:00.000Z</ShippedTime></Order></OrderArray>
+</GetOrdersResponse>''')
+
+        with tempfile.TemporaryDirectory() as cache_dir, patch.object(main, 'ORDERS_CACHE_DIR', cache_dir):
+            client = EbayClient()
+            first = list(client.iter_orders(days_back=30))
+            second = list(client.iter_orders(days_back=30))
+            list(client.iter_orders(days_back=30, use_cache=False))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.mock_send.call_count, 2)
+
+
+class _StubTransport(BaseAdapter):
+    """Transport adapter that answers from canned responses instead of the network."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self._queue = [_resp(200)]
+
+    def respond(self, *responses):
+        """Answer with these in order; the last one repeats for any further requests."""
+        self._queue = list(responses)
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        response = self._queue.pop(0) if len(self._queue) > 1 else self._queue[0]
+        response.request, response.url = request, request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def _serve_parcel(test, *replies):
+    """Serve Parcel POSTs from a local HTTP server, answering with ``replies`` in order.
+
+    Each reply is (status, headers); the last one repeats. Returns a ParcelClient
+    pointed at the server through its own HTTPAdapter (so the urllib3 Retry
+    config is exercised) and the list of POST paths received.
+    """
+    posts = []
+    queue = list(replies)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            posts.append(self.path)
+            status, headers = queue.pop(0) if len(queue) > 1 else queue[0]
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+
+    client = ParcelClient()
+    client._session.trust_env = False  # no proxies for the loopback server
+    client._session.mount('http://', client._session.get_adapter(client.base_url))
+    client.base_url = f'http://127.0.0.1:{server.server_port}/external/add-delivery/'
+    test.addCleanup(client.close)
+    return client, posts
+
+
+class TestParcelClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        env_patcher = patch.dict(os.environ, {'PARCEL_API_KEY': 'test_key'})
+        env_patcher.start()
+        cls.addClassCleanup(env_patcher.stop)
+
+    def setUp(self):
+        # Fresh client per test: the limiter and halt flag carry state between calls
+        self.client = ParcelClient()
+        # Replaces the production HTTPAdapter; tests of its Retry config use _serve_parcel
+        self.transport = _StubTransport()
+        self.client._session.mount("https://", self.transport)
+
+    def test_parcel_client_add_delivery_outcomes(self):
+        # (status, payload, text, expected (success, rate_limited))
+        cases = [
+            (200, None, '', (True, False)),
+            (400, {'error_message': 'Delivery already added'}, '', (True, False)),  # treated as success
+            (400, {'error_message': 'Unsupported carrier'}, '', (False, False)),
+            (500, None, 'Internal Server Error', (False, False)),
+            (429, {'error_message': 'Rate limit exceeded'}, 'Rate limit exceeded', (False, True)),
+        ]
+        for status, payload, text, expected in cases:
+            with self.subTest(status=status, payload=payload):
+                self.transport.respond(_resp(status, payload, text))
+                with patch.object(main, 'PARCEL_MAX_RETRIES', 0):
+                    self.assertEqual(self.client.add_delivery('123', 'usps', 'Test'), expected)
+
+    def test_parcel_client_add_delivery_request(self):
+        self.client.add_delivery('123', 'usps', 'Test')
+
+        self.assertEqual(len(self.transport.sent), 1)
+        request, kwargs = self.transport.sent[0]
+        self.assertEqual(json.loads(request.body)['tracking_number'], '123')
+        self.assertEqual(request.headers['api-key'], 'test_key')
+        self.assertIsNotNone(kwargs['timeout'])
+
+    def test_parcel_client_add_delivery_rate_limited(self):
+        self.transport.respond(_resp(429, {'error_message': 'Rate limit exceeded'}))
+
+        with patch.object(main, 'PARCEL_MAX_RETRIES', 2), \
+                patch.object(self.client._halted, 'wait', return_value=False) as mock_wait:
+            success, rate_limited = self.client.add_delivery('123', 'usps', 'Test')
+        self.assertFalse(success)
+        self.assertTrue(rate_limited)
+        self.assertEqual(len(self.transport.sent), 3)
+        self.assertEqual(mock_wait.call_count, 2)
+
+    def test_parcel_client_add_delivery_honors_retry_after(self):
+        self.transport.respond(_resp(429, headers={'Retry-After': '4'}), _resp(200))
+
+        with patch.object(self.client._halted, 'wait', return_value=False) as mock_wait:
+            success, rate_limited = self.client.add_delivery('123', 'usps', 'Test')
+        self.assertTrue(success)
+        self.assertFalse(rate_limited)
+        delay = mock_wait.call_args.args[0]
+        self.assertGreaterEqual(delay, 4)
+        self.assertLessEqual(delay, 6)
+
+    def test_parcel_client_sends_nothing_once_halted(self):
+        self.client.halt()
+
+        self.assertEqual(self.client.add_delivery('123', 'usps', 'Test'), (False, True))
+        self.assertEqual(self.transport.sent, [])
+
+    def test_parcel_client_add_delivery_missing_api_key(self):
         with patch.dict(os.environ, {}, clear=True):
             client = ParcelClient()
+        client._session.mount("https://", self.transport)
+
+        success, rate_limited = client.add_delivery('123', 'usps', 'Test')
+        self.assertFalse(success)
+        self.assertFalse(rate_limited)
+        self.assertEqual(self.transport.sent, [])
+
+    def test_parcel_client_slow_response_backs_off(self):
+        self.client.limiter = AdaptiveLimiter(initial=4, maximum=8)
+
+        with patch.object(main, 'PARCEL_LATENCY_TARGET_SEC', -1):
+            self.assertEqual(self.client.add_delivery('123', 'usps', 'Test'), (True, False))
+        self.assertEqual(self.client.limiter.limit, 2)
+
+    def test_parcel_client_429_is_retried_only_by_add_delivery(self):
+        # Through the real HTTPAdapter: urllib3 must not replay a 429 (or sleep its Retry-After)
+        client, posts = _serve_parcel(self, (429, {'Retry-After': '1'}))
+
+        with patch.object(main, 'PARCEL_MAX_RETRIES', 1), \
+                patch.object(client._halted, 'wait', return_value=False) as mock_wait:
+            self.assertEqual(client.add_delivery('123', 'usps', 'Test'), (False, True))
+        self.assertEqual(len(posts), 2)
+        self.assertEqual(mock_wait.call_count, 1)
+
+    def test_parcel_adapter_retries_transient_server_errors(self):
+        client, posts = _serve_parcel(self, (503, {}), (200, {}))
+
+        self.assertEqual(client.add_delivery('123', 'usps', 'Test'), (True, False))
+        self.assertEqual(posts, ['/external/add-delivery/'] * 2)
 
-            success, rate_limited = client.add_delivery('123', 'usps', 'Test')
-            self.assertFalse(success)
-            self.assertFalse(rate_limited)
-            mock_post.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main()
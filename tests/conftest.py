@@ -0,0 +1,12 @@
+import sys
+from pathlib import Path
+
+# Configure sys.path once for the whole session: the project root for `main`,
+# and a sibling APIHelpers checkout as a fallback when shared_ebay isn't installed
+EBAY2PARCEL_ROOT = Path(__file__).resolve().parents[1]
+if str(EBAY2PARCEL_ROOT) not in sys.path:
+    sys.path.insert(0, str(EBAY2PARCEL_ROOT))
+
+APIHELPERS_SRC = EBAY2PARCEL_ROOT.parent / "APIHelpers" / "src"
+if APIHELPERS_SRC.exists():
+    sys.path.append(str(APIHELPERS_SRC))
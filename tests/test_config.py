@@ -1,30 +1,26 @@
 import os
-import sys
 import unittest
-from pathlib import Path
-
-# Try importing shared_ebay, with fallback to local APIHelpers
-try:
-    from shared_ebay import config as shared_config
-except ImportError:
-    # Fallback to local APIHelpers repo if not installed
-    EBAY2PARCEL_ROOT = Path(__file__).resolve().parents[1]
-    APIHELPERS_SRC = EBAY2PARCEL_ROOT.parent / "APIHelpers" / "src"
-    if APIHELPERS_SRC.exists():
-        sys.path.insert(0, str(APIHELPERS_SRC))
-        from shared_ebay import config as shared_config
-    else:
-        raise ImportError("shared_ebay not found. Install with: pip install git+https://github.com/sburl/eBayAPIHelpers.git")
+from unittest.mock import patch
+
+# sys.path (project root, APIHelpers fallback) is set up in tests/conftest.py
+from shared_ebay import config as shared_config
 
 
 class ParcelConfigTests(unittest.TestCase):
     def setUp(self):
-        self._original_env = os.environ.copy()
-
-    def tearDown(self):
-        os.environ.clear()
-        os.environ.update(self._original_env)
-        shared_config._config = {}
+        env_patcher = patch.dict(os.environ)
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        self.addCleanup(self._reset_config)
+
+    @staticmethod
+    def _reset_config():
+        # get_config memoizes per suffix and reads env only on a miss, so any test that
+        # changes env must reset it: a dict in current shared_ebay, lru_cache if it moves to that
+        if hasattr(shared_config.get_config, 'cache_clear'):
+            shared_config.get_config.cache_clear()
+        else:
+            shared_config._config = {}
 
     def test_config_validate_success(self):
         os.environ["EBAY_APP_ID"] = "app-id"
@@ -1,106 +1,82 @@
-import os
+import json
 import sys
 import unittest
-from datetime import datetime, timedelta, timezone
-from pathlib import Path
+from datetime import datetime, timezone
 
-# Add project root to path with fallback to APIHelpers
-try:
-    from main import extract_tracking_info, _delivered_tracking_numbers
-except ImportError:
-    EBAY2PARCEL_ROOT = Path(__file__).resolve().parents[1]
-    sys.path.insert(0, str(EBAY2PARCEL_ROOT))
-    from main import extract_tracking_info, _delivered_tracking_numbers
+from main import extract_tracking_info, iter_tracking_info, _delivered_tracking_numbers, _is_delivered_status, _listify
 
 
-class TestDeliveredFiltering(unittest.TestCase):
-    """Test detection of delivered shipments"""
+def _interned_keys(pairs):
+    """json.loads hook: intern keys, as identifier-like string literals already are."""
+    return {sys.intern(key): value for key, value in pairs}
 
-    def test_delivered_via_delivery_status_field(self):
-        """Should skip tracking marked as delivered via DeliveryStatus"""
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '111',
-                            'ShippingCarrierUsed': 'USPS',
-                            'DeliveryStatus': 'Delivered'
-                        }
-                    }
+
+# Shared payloads, parsed once; extraction only reads its input, so tests pass
+# these as-is and splice in per-test fields with {**_UNDELIVERED_ORDER, ...}
+_FIXTURES = json.loads('''
+{
+    "undelivered_order": {
+        "ShippingDetails": {
+            "ShipmentTrackingDetails": {"ShipmentTrackingNumber": "444", "ShippingCarrierUsed": "USPS"}
+        }
+    },
+    "delivered_status": {
+        "OrderArray": {"Order": {
+            "ShippingDetails": {
+                "ShipmentTrackingDetails": {
+                    "ShipmentTrackingNumber": "111",
+                    "ShippingCarrierUsed": "USPS",
+                    "DeliveryStatus": "Delivered"
                 }
             }
-        }
-
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
-
-        self.assertEqual(len(shipments), 0)
-        self.assertEqual(delivered_skipped, 1)
-        self.assertEqual(aged_skipped, 0)
-
-    def test_delivered_via_actual_delivery_date(self):
-        """Should skip tracking with ActualDeliveryDate set"""
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '222',
-                            'ShippingCarrierUsed': 'UPS',
-                            'ActualDeliveryDate': '2024-11-10T12:00:00.000Z'
-                        }
-                    }
+        }}
+    },
+    "delivered_date": {
+        "OrderArray": {"Order": {
+            "ShippingDetails": {
+                "ShipmentTrackingDetails": {
+                    "ShipmentTrackingNumber": "222",
+                    "ShippingCarrierUsed": "UPS",
+                    "ActualDeliveryDate": "2024-11-10T12:00:00.000Z"
                 }
             }
-        }
-
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
-
-        self.assertEqual(len(shipments), 0)
-        self.assertEqual(delivered_skipped, 1)
-
-    def test_delivered_via_shipment_array(self):
-        """Should skip tracking marked delivered in ShipmentArray"""
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '333',
-                            'ShippingCarrierUsed': 'USPS'
-                        }
-                    },
-                    'ShipmentArray': {
-                        'Shipment': {
-                            'ActualDeliveryDate': '2024-11-10T12:00:00.000Z',
-                            'ShipmentTrackingDetails': {
-                                'ShipmentTrackingNumber': '333'
-                            }
-                        }
-                    }
+        }}
+    },
+    "delivered_in_shipment_array": {
+        "OrderArray": {"Order": {
+            "ShippingDetails": {
+                "ShipmentTrackingDetails": {"ShipmentTrackingNumber": "333", "ShippingCarrierUsed": "USPS"}
+            },
+            "ShipmentArray": {
+                "Shipment": {
+                    "ActualDeliveryDate": "2024-11-10T12:00:00.000Z",
+                    "ShipmentTrackingDetails": {"ShipmentTrackingNumber": "333"}
                 }
             }
-        }
+        }}
+    }
+}
+''', object_pairs_hook=_interned_keys)
+_UNDELIVERED_ORDER = _FIXTURES['undelivered_order']
+_UNDELIVERED_ORDERS = {'OrderArray': {'Order': _UNDELIVERED_ORDER}}
 
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
+def _shipped_at(shipped_time):
+    """Wrap the undelivered order with a ShippedTime in a GetOrders payload."""
+    return {'OrderArray': {'Order': {**_UNDELIVERED_ORDER, 'ShippedTime': shipped_time}}}
 
-        self.assertEqual(len(shipments), 0)
-        self.assertEqual(delivered_skipped, 1)
+
+class TestDeliveredFiltering(unittest.TestCase):
+    """Test detection of delivered shipments"""
+
+    def test_delivered_signals(self):
+        """Should skip tracking marked delivered by status, delivery date or ShipmentArray"""
+        for fixture in ('delivered_status', 'delivered_date', 'delivered_in_shipment_array'):
+            with self.subTest(fixture=fixture):
+                self.assertEqual(extract_tracking_info(_FIXTURES[fixture]), ([], 1, 0))
 
     def test_not_delivered_no_status(self):
         """Should include tracking with no delivery indicators"""
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '444',
-                            'ShippingCarrierUsed': 'USPS'
-                        }
-                    }
-                }
-            }
-        }
+        orders = _UNDELIVERED_ORDERS
 
         shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
 
@@ -112,106 +88,77 @@ class TestDeliveredFiltering(unittest.TestCase):
 class TestAgeBasedFiltering(unittest.TestCase):
     """Test age-based filtering of old shipments"""
 
-    def setUp(self):
-        self._original_env = os.environ.copy()
-
-    def tearDown(self):
-        os.environ.clear()
-        os.environ.update(self._original_env)
+    # Fixed reference time, passed to extraction so boundaries are exact
+    NOW = datetime(2024, 12, 1, tzinfo=timezone.utc)
+    RECENT = '2024-11-21T00:00:00.000Z'     # 10 days before NOW
+    OLD = '2024-10-02T00:00:00.000Z'        # 60 days
+    BOUNDARY = '2024-10-16T00:00:00.000Z'   # 46 days: a full day past the 45-day limit
 
     def test_recent_shipment_included(self):
         """Should include shipments within age limit"""
-        os.environ["MAX_SHIPMENT_AGE_DAYS"] = "45"
+        orders = _shipped_at(self.RECENT)
 
-        recent_time = (datetime.now(timezone.utc) - timedelta(days=10)).isoformat().replace('+00:00', 'Z')
-
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippedTime': recent_time,
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '555',
-                            'ShippingCarrierUsed': 'USPS'
-                        }
-                    }
-                }
-            }
-        }
-
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
+        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders, max_age_days=45, now=self.NOW)
 
         self.assertEqual(len(shipments), 1)
         self.assertEqual(aged_skipped, 0)
 
     def test_old_shipment_excluded(self):
         """Should exclude shipments older than age limit"""
-        os.environ["MAX_SHIPMENT_AGE_DAYS"] = "45"
+        orders = _shipped_at(self.OLD)
 
-        old_time = (datetime.now(timezone.utc) - timedelta(days=60)).isoformat().replace('+00:00', 'Z')
-
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippedTime': old_time,
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '666',
-                            'ShippingCarrierUsed': 'USPS'
-                        }
-                    }
-                }
-            }
-        }
-
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
+        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders, max_age_days=45, now=self.NOW)
 
         self.assertEqual(len(shipments), 0)
         self.assertEqual(aged_skipped, 1)
 
     def test_age_limit_boundary(self):
         """Should exclude shipments exactly at age limit"""
-        os.environ["MAX_SHIPMENT_AGE_DAYS"] = "45"
+        orders = _shipped_at(self.BOUNDARY)
+
+        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders, max_age_days=45, now=self.NOW)
+
+        self.assertEqual(len(shipments), 0)
+        self.assertEqual(aged_skipped, 1)
 
-        boundary_time = (datetime.now(timezone.utc) - timedelta(days=46)).isoformat().replace('+00:00', 'Z')
+        # One second inside the limit is kept
+        shipments, _, aged_skipped = extract_tracking_info(
+            _shipped_at('2024-10-16T00:00:01.000Z'), max_age_days=45, now=self.NOW
+        )
+        self.assertEqual(len(shipments), 1)
+        self.assertEqual(aged_skipped, 0)
 
+    def test_non_canonical_and_invalid_timestamps(self):
+        """Should age-check offset timestamps and keep unparseable ones"""
         orders = {
             'OrderArray': {
-                'Order': {
-                    'ShippedTime': boundary_time,
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '777',
-                            'ShippingCarrierUsed': 'USPS'
+                'Order': [
+                    {
+                        'ShippedTime': '2024-10-02T00:00:00+00:00',
+                        'ShippingDetails': {
+                            'ShipmentTrackingDetails': {'ShipmentTrackingNumber': '991'}
+                        }
+                    },
+                    {
+                        'ShippedTime': 'not-a-timestamp',
+                        'ShippingDetails': {
+                            'ShipmentTrackingDetails': {'ShipmentTrackingNumber': '992'}
                         }
                     }
-                }
+                ]
             }
         }
 
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
+        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders, max_age_days=45, now=self.NOW)
 
-        self.assertEqual(len(shipments), 0)
+        self.assertEqual([s['tracking_number'] for s in shipments], ['992'])
         self.assertEqual(aged_skipped, 1)
 
     def test_no_timestamp_included(self):
         """Should include shipments with no timestamp (can't determine age)"""
-        os.environ["MAX_SHIPMENT_AGE_DAYS"] = "45"
+        orders = _UNDELIVERED_ORDERS
 
-        orders = {
-            'OrderArray': {
-                'Order': {
-                    'ShippingDetails': {
-                        'ShipmentTrackingDetails': {
-                            'ShipmentTrackingNumber': '888',
-                            'ShippingCarrierUsed': 'USPS'
-                        }
-                    }
-                }
-            }
-        }
-
-        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders)
+        shipments, delivered_skipped, aged_skipped = extract_tracking_info(orders, max_age_days=45, now=self.NOW)
 
         self.assertEqual(len(shipments), 1)
         self.assertEqual(aged_skipped, 0)
@@ -312,17 +259,9 @@ class TestMixedPayloadShapes(unittest.TestCase):
 
     def test_empty_orders(self):
         """Should handle empty or missing OrderArray gracefully"""
-        # Test None
-        shipments, delivered, aged = extract_tracking_info(None)
-        self.assertEqual(len(shipments), 0)
-
-        # Test empty dict
-        shipments, delivered, aged = extract_tracking_info({})
-        self.assertEqual(len(shipments), 0)
-
-        # Test empty OrderArray
-        shipments, delivered, aged = extract_tracking_info({'OrderArray': {}})
-        self.assertEqual(len(shipments), 0)
+        for orders in (None, {}, {'OrderArray': {}}):
+            with self.subTest(orders=orders):
+                self.assertEqual(extract_tracking_info(orders), ([], 0, 0))
 
     def test_missing_optional_fields(self):
         """Should handle orders with missing optional fields"""
@@ -348,6 +287,58 @@ class TestMixedPayloadShapes(unittest.TestCase):
         self.assertIsNone(shipments[0]['carrier'])
 
 
+    def test_iter_tracking_info_is_lazy_and_counts_skips(self):
+        """Should yield shipments one at a time and accumulate skip counters"""
+        orders = {
+            'OrderArray': {
+                'Order': [
+                    {
+                        'ShippingDetails': {
+                            'ShipmentTrackingDetails': {
+                                'ShipmentTrackingNumber': '111',
+                                'DeliveryStatus': 'Delivered'
+                            }
+                        }
+                    },
+                    {
+                        'ShippingDetails': {
+                            'ShipmentTrackingDetails': {'ShipmentTrackingNumber': '222'}
+                        }
+                    },
+                    {
+                        'ShippingDetails': {
+                            'ShipmentTrackingDetails': {'ShipmentTrackingNumber': '333'}
+                        }
+                    }
+                ]
+            }
+        }
+
+        stats = {}
+        shipments = iter_tracking_info(orders, stats)
+
+        self.assertEqual(next(shipments)['tracking_number'], '222')
+        self.assertEqual(stats, {'orders': 2, 'delivered': 1, 'aged': 0, 'known': 0})
+        self.assertEqual([s['tracking_number'] for s in shipments], ['333'])
+
+    def test_known_tracking_numbers_are_skipped(self):
+        """Should skip already-synced tracking numbers and count them"""
+        orders = {
+            'OrderArray': {
+                'Order': [
+                    {'ShippingDetails': {'ShipmentTrackingDetails': {'ShipmentTrackingNumber': number}}}
+                    for number in ('111', '222')
+                ]
+            }
+        }
+
+        stats = {}
+        shipments = list(iter_tracking_info(orders, stats, known_tracking={'111'}))
+
+        self.assertEqual([s['tracking_number'] for s in shipments], ['222'])
+        self.assertEqual(stats['known'], 1)
+
+
 class TestDeliveredTrackingNumbersHelper(unittest.TestCase):
     """Test the _delivered_tracking_numbers helper function"""
 
@@ -414,6 +405,14 @@ class TestDeliveredTrackingNumbersHelper(unittest.TestCase):
         delivered = _delivered_tracking_numbers(order)
         self.assertEqual(len(delivered), 0)
 
+    def test_is_delivered_status_values(self):
+        """Should recognise delivered statuses by set lookup and by fallback scan"""
+        self.assertTrue(_is_delivered_status('Delivered'))
+        self.assertTrue(_is_delivered_status('DeliveredToMailbox'))
+        self.assertFalse(_is_delivered_status('InTransit'))
+        self.assertFalse(_is_delivered_status(None))
+        self.assertFalse(_is_delivered_status(''))
+
     def test_missing_shipment_array(self):
         """Should handle orders without ShipmentArray"""
         order = {}
@@ -421,6 +420,18 @@ class TestDeliveredTrackingNumbersHelper(unittest.TestCase):
         delivered = _delivered_tracking_numbers(order)
         self.assertEqual(len(delivered), 0)
 
+    def test_empty_shipment_array_element(self):
+        """Should handle an empty ShipmentArray element (parsed as None)"""
+        delivered = _delivered_tracking_numbers({'ShipmentArray': None})
+        self.assertEqual(len(delivered), 0)
+
+    def test_listify(self):
+        """Should wrap a lone element and treat missing/empty fields as no elements"""
+        self.assertEqual(_listify({'a': 1}), [{'a': 1}])
+        self.assertEqual(_listify([{'a': 1}]), [{'a': 1}])
+        self.assertEqual(_listify(None), [])
+        self.assertEqual(_listify({}), [])
+
 
 if __name__ == '__main__':
     unittest.main()
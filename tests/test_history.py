@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import main
+
+
+class TestTrackingHistoryFile(unittest.TestCase):
+    """Test JSONL tracking history persistence"""
+
+    def setUp(self):
+        self._original_cwd = os.getcwd()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self._tmpdir.name)
+
+    def tearDown(self):
+        os.chdir(self._original_cwd)
+        self._tmpdir.cleanup()
+
+    def test_missing_file_loads_empty(self):
+        """Should return an empty history when no file exists"""
+        self.assertEqual(main.load_history(), {})
+
+    def test_append_then_load_round_trip(self):
+        """Should append one line per entry and read them back in order"""
+        first = {'tracking_number': '111', 'added_at': '2024-11-10T12:00:00+00:00'}
+        second = {'tracking_number': '222', 'added_at': '2024-11-11T12:00:00+00:00'}
+
+        self.assertTrue(main.append_history([first]))
+        self.assertTrue(main.append_history([second]))
+
+        with open(main.HISTORY_FILE) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(main.load_history(), {'111': first['added_at'], '222': second['added_at']})
+
+    def test_migrates_legacy_json_on_first_append(self):
+        """Should carry legacy tracking_history.json records into the JSONL file"""
+        legacy = [{'tracking_number': '111', 'added_at': '2024-11-10T12:00:00+00:00'}]
+        with open(main.LEGACY_HISTORY_FILE, 'w') as f:
+            json.dump(legacy, f, indent=2)
+
+        self.assertEqual(main.load_history(), {'111': '2024-11-10T12:00:00+00:00'})
+
+        new = {'tracking_number': '222', 'added_at': '2024-11-11T12:00:00+00:00'}
+        self.assertTrue(main.append_history([new]))
+
+        self.assertEqual(main.load_history(), {
+            '111': '2024-11-10T12:00:00+00:00',
+            '222': '2024-11-11T12:00:00+00:00'
+        })
+
+    def test_load_tracking_numbers_returns_set(self):
+        """Should reduce history records to a set of tracking numbers"""
+        main.append_history([
+            {'tracking_number': '111', 'added_at': 'a'},
+            {'tracking_number': '222', 'added_at': 'b'},
+            {'tracking_number': '111', 'added_at': 'c'}
+        ])
+
+        self.assertEqual(main.load_tracking_numbers(), {'111', '222'})
+
+    def test_duplicate_records_collapse_to_earliest(self):
+        """Should keep one entry per tracking number, from its first record"""
+        main.append_history([
+            {'tracking_number': '111', 'added_at': 'a'},
+            {'tracking_number': '111', 'added_at': 'b'}
+        ])
+
+        self.assertEqual(main.load_history(), {'111': 'a'})
+
+    def test_corrupt_line_is_skipped(self):
+        """Should keep readable records when one line is torn"""
+        with open(main.HISTORY_FILE, 'w') as f:
+            f.write('{"tracking_number":"111","added_at":"x"}\n{"tracking_nu\n')
+
+        self.assertEqual(main.load_history(), {'111': 'x'})
+
+    def test_line_torn_mid_character_is_skipped(self):
+        """Should treat invalid UTF-8 in a torn line like any other corrupt line"""
+        with open(main.HISTORY_FILE, 'wb') as f:
+            f.write(b'{"tracking_number":"111","added_at":"x"}\n{"tracking_number":"\xc3')
+
+        self.assertEqual(main.load_history(), {'111': 'x'})
+
+    def test_prune_evicts_old_entries_and_compacts_file(self):
+        """Should drop entries past the TTL and rewrite the file without them"""
+        recent = datetime.now(timezone.utc).isoformat()
+        main.append_history([
+            {'tracking_number': '111', 'added_at': '2020-01-01T00:00:00+00:00'},
+            {'tracking_number': '222', 'added_at': recent},
+            {'tracking_number': '333', 'added_at': 'not a date'}
+        ])
+
+        self.assertEqual(main.prune_history(ttl_days=90), {'222': recent, '333': 'not a date'})
+        self.assertEqual(main.load_history(), {'222': recent, '333': 'not a date'})
+
+    def test_prune_dry_run_leaves_file_alone(self):
+        """Should report the pruned view without rewriting in dry-run mode"""
+        main.append_history([{'tracking_number': '111', 'added_at': '2020-01-01T00:00:00+00:00'}])
+
+        self.assertEqual(main.prune_history(ttl_days=90, dry_run=True), {})
+        self.assertEqual(main.load_history(), {'111': '2020-01-01T00:00:00+00:00'})
+
+    def test_prune_ttl_never_undercuts_the_age_filter(self):
+        """Should raise a TTL below MAX_SHIPMENT_AGE_DAYS + 1 so syncable shipments stay known"""
+        now = datetime.now(timezone.utc)
+        within = (now - timedelta(days=30)).isoformat()
+        beyond = (now - timedelta(days=60)).isoformat()
+        main.append_history([
+            {'tracking_number': '111', 'added_at': within},
+            {'tracking_number': '222', 'added_at': beyond}
+        ])
+
+        with patch.object(main, 'MAX_SHIPMENT_AGE_DAYS', 45):
+            self.assertEqual(main.prune_history(ttl_days=10), {'111': within})
+
+    def test_dry_run_writes_nothing(self):
+        """Should not touch the filesystem in dry-run mode"""
+        self.assertTrue(main.append_history([{'tracking_number': '111'}], dry_run=True))
+        self.assertFalse(os.path.exists(main.HISTORY_FILE))
+
+
+if __name__ == '__main__':
+    unittest.main()